@@ -0,0 +1,103 @@
+"""
+Compares loading every page of places with fetch_all against bulk_load
+with different numbers of decoding processes. Pages are served from
+memory by a stub transport, so only the client's own work is measured.
+
+    python benchmarks/bench_etl.py [places] [page_size] [max_processes]
+"""
+from __future__ import print_function, unicode_literals, division
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shareabouts import ShareaboutsApi
+from shareabouts.compact import CompactPlaceSet
+from shareabouts.etl import bulk_load
+from fakeapi import make_place
+
+try:
+    # Python 2
+    from urlparse import urlsplit, parse_qsl
+except ImportError:
+    # Python 3
+    from urllib.parse import urlsplit, parse_qsl
+
+
+class StubResponse (object):
+    status_code = 200
+    elapsed = None
+
+    def __init__(self, content):
+        self.content = content
+        self.headers = {'Content-Length': str(len(content))}
+
+    def close(self):
+        pass
+
+
+class PageTransport (object):
+    """
+    Serves pre-encoded pages of places for any url with a page parameter.
+    """
+    def __init__(self, root, count, page_size, seed=0):
+        rng = random.Random(seed)
+        places = [make_place(pk, rng) for pk in range(1, count + 1)]
+        url = root + 'bench/datasets/bench/places'
+        page_count = (count + page_size - 1) // page_size
+        self.pages = {}
+        for page in range(1, page_count + 1):
+            def page_url(number):
+                if 1 <= number <= page_count:
+                    return '{0}?page_size={1}&page={2}'.format(url, page_size, number)
+            self.pages[page] = json.dumps({
+                'type': 'FeatureCollection',
+                'metadata': {'length': count, 'page': page,
+                             'next': page_url(page + 1), 'previous': page_url(page - 1)},
+                'features': places[(page - 1) * page_size:page * page_size],
+            }).encode('utf-8')
+
+    def request(self, method, url, **kwargs):
+        page = int(dict(parse_qsl(urlsplit(url).query)).get('page', 1))
+        return StubResponse(self.pages[page])
+
+
+def main(count=100000, page_size=1000, max_processes=4):
+    root = 'http://bench/api/v2/'
+    transport = PageTransport(root, count, page_size)
+    api = ShareaboutsApi(root=root, transport=transport)
+    total_bytes = sum(len(page) for page in transport.pages.values())
+    print('{0} places in {1} pages, {2:.1f} MB'.format(count, len(transport.pages), total_bytes / 1e6))
+
+    def report(label, start, places):
+        elapsed = time.time() - start
+        print('{0:>32}: {1:7.3f} s, {2:9.0f} places/s, {3} loaded'.format(
+            label, elapsed, count / elapsed, len(places._data)))
+
+    dataset = api.account('bench').dataset('bench')
+    places = CompactPlaceSet(api, dataset)
+    start = time.time()
+    for _ in places.fetch_all(page_size=page_size, concurrency=4):
+        pass
+    report('fetch_all, CompactPlaceSet', start, places)
+
+    for processes in [0] + list(range(1, max_processes + 1)):
+        places = CompactPlaceSet(api, dataset)
+        start = time.time()
+        for _ in bulk_load(places, processes=processes, concurrency=4, page_size=page_size):
+            pass
+        report('bulk_load, {0} processes'.format(processes), start, places)
+
+    places = api.account('bench').dataset('bench2').places
+    start = time.time()
+    for _ in bulk_load(places, processes=max_processes, normalize=False, page_size=page_size):
+        pass
+    report('bulk_load, PlaceSet, records', start, places)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,79 @@
+"""
+Measures the memory held by a place collection loaded with the regular
+ShareaboutsPlaceSet and with CompactPlaceSet, using tracemalloc.
+
+    python benchmarks/bench_memory.py [places]
+"""
+from __future__ import print_function, unicode_literals, division
+
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shareabouts import ShareaboutsApi
+from shareabouts.compact import CompactPlaceSet
+from shareabouts.models import ShareaboutsPlaceSet
+
+LOCATION_TYPES = ['landmark', 'park', 'bikeshare', 'school', 'library']
+
+
+def make_places(count, seed=0):
+    rng = random.Random(seed)
+    for pk in range(count):
+        yield {
+            'type': 'Feature', 'id': pk,
+            'geometry': {'type': 'Point',
+                         'coordinates': [rng.uniform(-75.3, -74.9),
+                                         rng.uniform(39.85, 40.15)]},
+            'properties': {
+                'name': 'Place {0}'.format(pk),
+                'location_type': rng.choice(LOCATION_TYPES),
+                'description': 'A place worth noting, number {0}.'.format(pk),
+                'submitter_name': 'user{0}'.format(rng.randint(1, 500)),
+                'private-email': None,
+                'created_datetime': '2013-05-{0:02d}T12:00:00Z'.format(rng.randint(1, 28)),
+                'updated_datetime': '2013-06-{0:02d}T12:00:00Z'.format(rng.randint(1, 28)),
+            },
+        }
+
+
+def measure(collection_class, pages):
+    api = ShareaboutsApi()
+    dataset = api.account('bench').dataset('bench')
+
+    # Parsing is included, as fetch_all would parse each page before
+    # handing its records to the collection.
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    places = collection_class(api, dataset)
+    for page in pages:
+        places.update(json.loads(page))
+    elapsed = time.time() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return places, current, peak, elapsed
+
+
+def main(count=100000, page_size=1000):
+    records = list(make_places(count))
+    pages = [json.dumps(records[i:i + page_size])
+             for i in range(0, count, page_size)]
+    del records
+
+    for collection_class in (ShareaboutsPlaceSet, CompactPlaceSet):
+        places, current, peak, elapsed = measure(collection_class, pages)
+        print('{0:>20}: {1:8.1f} MB held, {2:8.1f} MB peak, {3:6.2f} s to load'.format(
+            collection_class.__name__, current / 2 ** 20, peak / 2 ** 20, elapsed))
+        del places
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
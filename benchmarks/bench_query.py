@@ -0,0 +1,93 @@
+"""
+Compares field queries on a ShareaboutsPlaceSet answered by its indexes
+with the same queries as loops over every place.
+
+    python benchmarks/bench_query.py [places] [queries]
+"""
+from __future__ import print_function, unicode_literals, division
+
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shareabouts import ShareaboutsApi
+
+LOCATION_TYPES = ['landmark', 'park', 'bikeshare', 'school', 'library']
+
+
+def make_places(count, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime(2013, 1, 1)
+    for pk in range(count):
+        created = start + datetime.timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+        yield {'type': 'Feature', 'id': pk,
+               'geometry': {'type': 'Point', 'coordinates': [-75.1, 39.95]},
+               'properties': {'name': 'Place {0}'.format(pk),
+                              'location_type': rng.choice(LOCATION_TYPES),
+                              'submitter_name': 'user{0}'.format(rng.randint(1, 2000)),
+                              'created_datetime': created.isoformat() + 'Z'}}
+
+
+def linear_filter(places, key, value):
+    return [place for place in places if place.get(key) == value]
+
+
+def linear_count_by(places, key):
+    counts = {}
+    for place in places:
+        value = place.get(key)
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+def linear_range(places, key, start, end):
+    return sorted((place for place in places if start <= place.get(key) < end),
+                  key=lambda place: place.get(key))
+
+
+def timed(label, func, queries):
+    start = time.time()
+    for query in queries:
+        func(*query)
+    elapsed = time.time() - start
+    print('{0:>28}: {1:9.3f} ms/query'.format(label, elapsed / len(queries) * 1000))
+
+
+def main(count=100000, query_count=20):
+    api = ShareaboutsApi()
+    places = api.account('bench').dataset('bench').places
+    places.update(make_places(count))
+
+    rng = random.Random(1)
+    users = [('submitter_name', 'user{0}'.format(rng.randint(1, 2000)))
+             for _ in range(query_count)]
+    types = [('location_type', rng.choice(LOCATION_TYPES)) for _ in range(query_count)]
+    months = [('created_datetime', '2013-{0:02d}-01T00:00:00Z'.format(month),
+               '2013-{0:02d}-01T00:00:00Z'.format(month + 1))
+              for month in [rng.randint(1, 11) for _ in range(query_count)]]
+
+    timed('scan count(type)', lambda *q: places.count(**{q[0]: q[1]}), types)
+    timed('scan count_by(type)', places.count_by, [('location_type',)])
+
+    start = time.time()
+    places.index_on('location_type')
+    places.index_on('submitter_name')
+    places.index_on('created_datetime', ordered=True)
+    places.range('created_datetime', None, None)
+    print('{0:>28}: {1:9.3f} s'.format('index build', time.time() - start))
+
+    timed('linear filter(user)', lambda *q: linear_filter(places, *q), users)
+    timed('indexed filter(user)', lambda *q: places.filter(**{q[0]: q[1]}), users)
+    timed('linear count_by(type)', lambda *q: linear_count_by(places, *q), [('location_type',)])
+    timed('indexed count_by(type)', places.count_by, [('location_type',)])
+    timed('indexed count(type)', lambda *q: places.count(**{q[0]: q[1]}), types)
+    timed('linear range(month)', lambda *q: linear_range(places, *q), months)
+    timed('indexed range(month)', places.range, months)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,73 @@
+"""
+Compares GridIndex queries on a ShareaboutsPlaceSet with a linear scan over
+every place's geometry.
+
+    python benchmarks/bench_spatial.py [places] [queries]
+"""
+from __future__ import print_function, unicode_literals, division
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shareabouts import ShareaboutsApi
+from shareabouts.spatial import distance
+
+
+def make_places(count, seed=0):
+    rng = random.Random(seed)
+    for pk in range(count):
+        x, y = rng.uniform(-75.3, -74.9), rng.uniform(39.85, 40.15)
+        yield {'type': 'Feature', 'id': pk,
+               'geometry': {'type': 'Point', 'coordinates': [x, y]},
+               'properties': {'name': 'Place {0}'.format(pk)}}
+
+
+def linear_bbox(places, minx, miny, maxx, maxy):
+    found = []
+    for place in places:
+        x, y = place['geometry']['coordinates']
+        if minx <= x <= maxx and miny <= y <= maxy:
+            found.append(place)
+    return found
+
+
+def linear_nearest(places, x, y, k):
+    ranked = sorted(places, key=lambda p: distance(x, y, *p['geometry']['coordinates']))
+    return ranked[:k]
+
+
+def timed(label, func, queries):
+    start = time.time()
+    for query in queries:
+        func(*query)
+    elapsed = time.time() - start
+    print('{0:>24}: {1:9.3f} ms/query'.format(label, elapsed / len(queries) * 1000))
+
+
+def main(count=100000, query_count=50):
+    api = ShareaboutsApi()
+    places = api.account('bench').dataset('bench').places
+    places.update(make_places(count))
+
+    start = time.time()
+    places.spatial_index(cell_size=0.005)
+    print('{0:>24}: {1:9.3f} s'.format('index build', time.time() - start))
+
+    rng = random.Random(1)
+    points = [(rng.uniform(-75.3, -74.9), rng.uniform(39.85, 40.15))
+              for _ in range(query_count)]
+    boxes = [(x, y, x + 0.01, y + 0.01) for x, y in points]
+
+    timed('linear bbox', lambda *b: linear_bbox(places, *b), boxes)
+    timed('indexed bbox', places.within_bbox, boxes)
+    timed('linear nearest(10)', lambda x, y: linear_nearest(places, x, y, 10), points)
+    timed('indexed nearest(10)', lambda x, y: places.nearest(x, y, 10), points)
+    timed('indexed radius(500m)', lambda x, y: places.within_radius(x, y, 500), points)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,56 @@
+"""
+Compares requests/sec for ShareaboutsApi.send with a connection per request
+(SimpleTransport) against a pooled keep-alive session (PooledTransport).
+
+    python benchmarks/bench_transport.py [requests] [threads]
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shareabouts import ShareaboutsApi, PooledTransport, SimpleTransport
+from stubserver import start_server
+
+
+def run(api, url, count, threads):
+    per_thread = count // threads
+
+    def worker():
+        for _ in range(per_thread):
+            api.send_and_parse('GET', url)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.time()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.time() - start
+    return (per_thread * threads) / elapsed
+
+
+def main(count=2000, threads=4):
+    server = start_server()
+    url = server.root + 'alice/datasets/demo'
+
+    transports = [
+        ('simple', SimpleTransport()),
+        ('pooled', PooledTransport(pool_maxsize=threads)),
+    ]
+    for name, transport in transports:
+        api = ShareaboutsApi(root=server.root, transport=transport)
+        api.authenticate_with_key('benchmark')
+        rate = run(api, url, count, threads)
+        transport.close()
+        print('{0:>8}: {1:8.1f} requests/sec'.format(name, rate))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
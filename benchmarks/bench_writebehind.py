@@ -0,0 +1,56 @@
+"""
+Compares saving after every edit, as an editing session does, with and
+without a WriteBehindQueue, against the fake API with some latency.
+
+    python benchmarks/bench_writebehind.py [places] [edits_per_place] [latency]
+"""
+from __future__ import print_function, unicode_literals, division
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from shareabouts import ShareaboutsApi, WriteBehindQueue
+from fakeapi import start_fake_api
+
+
+def edit_session(server, places, edits, write_behind=None):
+    api = ShareaboutsApi(root=server.root, write_behind=write_behind)
+    dataset = api.account('alice').dataset('demo')
+    dataset.places.fetch(page_size=places)
+
+    start = time.time()
+    latencies = []
+    for edit in range(edits):
+        for place in dataset.places:
+            place['description'] = 'Edit {0}'.format(edit)
+            saved = time.time()
+            place.save()
+            latencies.append(time.time() - saved)
+    if write_behind is not None:
+        write_behind.flush()
+    elapsed = time.time() - start
+
+    latencies.sort()
+    return elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main(places=50, edits=10, latency=0.01):
+    server = start_fake_api(places=places, latency=latency)
+    try:
+        for label, queue in [('save() per edit', None),
+                             ('write-behind', WriteBehindQueue(max_delay=0.1))]:
+            elapsed, p50, p99 = edit_session(server, int(places), int(edits), queue)
+            requests = places * edits if queue is None else queue.stats()['sent']
+            print('{0:>16}: {1:7.3f} s, {2:5d} requests, save() p50 {3:8.3f} ms, p99 {4:8.3f} ms'.format(
+                label, elapsed, requests, p50 * 1000, p99 * 1000))
+            if queue is not None:
+                queue.close()
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,238 @@
+"""
+An in-process fake of the Shareabouts API, for benchmarks. It serves the
+endpoints in ``ShareaboutsApi.uri_templates`` from memory, with the same
+paging metadata (``length``, ``page``, ``next``, ``previous``) as the real
+server, and can add a fixed latency to every response.
+
+    server = start_fake_api(places=10000, latency=0.005)
+    api = ShareaboutsApi(root=server.root)
+"""
+from __future__ import unicode_literals
+
+import json
+import random
+import re
+import threading
+import time
+
+from stubserver import StubHandler, ThreadingServer
+
+try:
+    # Python 2
+    from urlparse import urlsplit, parse_qsl
+    from urllib import urlencode
+except ImportError:
+    # Python 3
+    from urllib.parse import urlsplit, parse_qsl, urlencode
+
+
+LOCATION_TYPES = ['landmark', 'park', 'bikeshare', 'school', 'library']
+
+
+def make_place(pk, rng, padding=0):
+    """
+    Returns a place feature with typical properties, plus a ``notes``
+    property of ``padding`` characters to vary the payload size.
+    """
+    place = {
+        'type': 'Feature', 'id': pk,
+        'geometry': {'type': 'Point',
+                     'coordinates': [rng.uniform(-75.3, -74.9),
+                                     rng.uniform(39.85, 40.15)]},
+        'properties': {
+            'name': 'Place {0}'.format(pk),
+            'location_type': rng.choice(LOCATION_TYPES),
+            'description': 'A place worth noting, number {0}.'.format(pk),
+            'submitter_name': 'user{0}'.format(rng.randint(1, 500)),
+            'created_datetime': '2013-05-{0:02d}T12:00:00Z'.format(rng.randint(1, 28)),
+            'updated_datetime': '2013-06-{0:02d}T12:00:00Z'.format(rng.randint(1, 28)),
+        },
+    }
+    if padding:
+        place['properties']['notes'] = 'x' * padding
+    return place
+
+
+class FakeData (object):
+    """
+    The places and submissions of a single dataset, ``alice/demo``.
+    """
+    username = 'alice'
+    slug = 'demo'
+
+    def __init__(self, places=1000, submissions_per_place=0, padding=0, seed=0):
+        rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.places = dict((pk, make_place(pk, rng, padding))
+                           for pk in range(1, places + 1))
+        self.submissions = {}
+        for pk in self.places:
+            self.submissions[(pk, 'comments')] = [
+                {'id': pk * 1000 + n, 'comment': 'Comment {0} on place {1}'.format(n, pk),
+                 'submitter_name': 'user{0}'.format(rng.randint(1, 500))}
+                for n in range(submissions_per_place)]
+        self.next_id = places + 1
+
+
+class FakeApiHandler (StubHandler):
+    latency = 0
+    data = None
+
+    routes = [
+        (r'^(?P<username>[^/]+)/datasets/?$', 'datasets'),
+        (r'^(?P<username>[^/]+)/datasets/(?P<slug>[^/]+)/?$', 'dataset'),
+        (r'^(?P<username>[^/]+)/datasets/(?P<slug>[^/]+)/places/?$', 'places'),
+        (r'^(?P<username>[^/]+)/datasets/(?P<slug>[^/]+)/places/(?P<pk>\d+)/?$', 'place'),
+        (r'^(?P<username>[^/]+)/datasets/(?P<slug>[^/]+)/places/(?P<pk>\d+)/(?P<set_name>[^/]+)/?$', 'place_submissions'),
+        (r'^(?P<username>[^/]+)/datasets/(?P<slug>[^/]+)/(?P<set_name>[^/]+)/?$', 'all_submissions'),
+    ]
+
+    def root(self):
+        return 'http://{0}:{1}/api/v2/'.format(*self.server.server_address)
+
+    def dataset_url(self):
+        return '{0}{1}/datasets/{2}'.format(self.root(), self.data.username, self.data.slug)
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        path = parts.path[len('/api/v2/'):]
+        for pattern, name in self.routes:
+            match = re.match(pattern, path)
+            if match:
+                return name, match.groupdict(), dict(parse_qsl(parts.query))
+        return None, {}, {}
+
+    def _send_json(self, status, data=None):
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+
+    def _place(self, pk):
+        place = json.loads(json.dumps(self.data.places[pk]))
+        place['properties']['url'] = '{0}/places/{1}'.format(self.dataset_url(), pk)
+        return place
+
+    def _page(self, url, items, query):
+        page_size = int(query.get('page_size', 100))
+        page = int(query.get('page', 1))
+        start = (page - 1) * page_size
+
+        def page_url(number):
+            return '{0}?{1}'.format(url, urlencode(dict(query, page=number, page_size=page_size)))
+
+        return items[start:start + page_size], {
+            'length': len(items),
+            'page': page,
+            'next': page_url(page + 1) if start + page_size < len(items) else None,
+            'previous': page_url(page - 1) if page > 1 else None,
+        }
+
+    def do_GET(self):
+        name, args, query = self._route()
+        data = self.data
+
+        if name == 'datasets':
+            self._send_json(200, {'metadata': {'length': 1, 'page': 1, 'next': None, 'previous': None},
+                                  'results': [{'slug': data.slug, 'url': self.dataset_url()}]})
+        elif name == 'dataset':
+            self._send_json(200, {'slug': data.slug, 'display_name': 'Demo',
+                                  'url': self.dataset_url()})
+        elif name == 'places':
+            with data.lock:
+                pks = sorted(data.places)
+            url = '{0}/places'.format(self.dataset_url())
+            pks, metadata = self._page(url, pks, query)
+            with data.lock:
+                features = [self._place(pk) for pk in pks if pk in data.places]
+            self._send_json(200, {'type': 'FeatureCollection', 'metadata': metadata,
+                                  'features': features})
+        elif name == 'place' and int(args['pk']) in data.places:
+            with data.lock:
+                place = self._place(int(args['pk']))
+            self._send_json(200, place)
+        elif name == 'place_submissions':
+            url = '{0}/places/{1}/{2}'.format(self.dataset_url(), args['pk'], args['set_name'])
+            submissions = data.submissions.get((int(args['pk']), args['set_name']), [])
+            results, metadata = self._page(url, submissions, query)
+            self._send_json(200, {'metadata': metadata, 'results': results})
+        elif name == 'all_submissions':
+            url = '{0}/{1}'.format(self.dataset_url(), args['set_name'])
+            submissions = []
+            for (pk, set_name), items in sorted(data.submissions.items()):
+                if set_name == args['set_name']:
+                    place_url = '{0}/places/{1}'.format(self.dataset_url(), pk)
+                    submissions.extend(dict(item, place=place_url) for item in items)
+            results, metadata = self._page(url, submissions, query)
+            self._send_json(200, {'metadata': metadata, 'results': results})
+        else:
+            self._send_json(404, {'detail': 'Not found.'})
+
+    def _write_place(self, pk, partial):
+        body = self._read_json()
+        with self.data.lock:
+            place = self.data.places.get(pk)
+            if place is None or not partial:
+                place = self.data.places[pk] = {'type': 'Feature', 'id': pk,
+                                                'geometry': None, 'properties': {}}
+            if 'geometry' in body:
+                place['geometry'] = body['geometry']
+            place['properties'].update(body.get('properties', {}))
+            place['properties'].pop('url', None)
+            return self._place(pk)
+
+    def do_POST(self):
+        name, args, query = self._route()
+        if name != 'places':
+            return self._send_json(405, {'detail': 'Method not allowed.'})
+        with self.data.lock:
+            pk = self.data.next_id
+            self.data.next_id += 1
+        self._send_json(201, self._write_place(pk, partial=False))
+
+    def do_PUT(self):
+        name, args, query = self._route()
+        if name != 'place':
+            return self._send_json(405, {'detail': 'Method not allowed.'})
+        self._send_json(200, self._write_place(int(args['pk']), partial=False))
+
+    def do_PATCH(self):
+        name, args, query = self._route()
+        if name != 'place' or int(args['pk']) not in self.data.places:
+            return self._send_json(404, {'detail': 'Not found.'})
+        self._send_json(200, self._write_place(int(args['pk']), partial=True))
+
+    def do_DELETE(self):
+        name, args, query = self._route()
+        with self.data.lock:
+            found = name == 'place' and self.data.places.pop(int(args['pk']), None)
+        self._send_json(204 if found else 404)
+
+
+def start_fake_api(places=1000, submissions_per_place=0, padding=0, latency=0,
+                   host='127.0.0.1', port=0):
+    """
+    Starts a fake API on a background thread and returns the server. The
+    API root is ``server.root``, and the dataset is at
+    ``api.account('alice').dataset('demo')``.
+    """
+    handler_class = type(str('FakeApiHandler'), (FakeApiHandler,), {
+        'latency': latency,
+        'data': FakeData(places, submissions_per_place, padding),
+    })
+    server = ThreadingServer((host, port), handler_class)
+    server.root = 'http://{0}:{1}/api/v2/'.format(*server.server_address)
+    server.data = handler_class.data
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
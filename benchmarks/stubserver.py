@@ -0,0 +1,69 @@
+"""
+A minimal in-process HTTP server that answers every request with a small
+JSON body. It speaks HTTP/1.1, so clients that keep connections alive can
+reuse them.
+"""
+from __future__ import unicode_literals
+
+import json
+import threading
+
+try:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+class StubHandler (BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    body = json.dumps({'id': 1, 'name': 'stub'}).encode('utf-8')
+
+    def _respond(self, status=200):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        body = self.body if status != 204 else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond(200)
+
+    def do_PUT(self):
+        self._respond(200)
+
+    def do_POST(self):
+        self._respond(201)
+
+    def do_DELETE(self):
+        self._respond(204)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingServer (ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_server(handler_class=StubHandler, host='127.0.0.1', port=0):
+    """
+    Starts a server on a background thread and returns it. The root url is
+    available as ``server.root``.
+    """
+    server = ThreadingServer((host, port), handler_class)
+    server.root = 'http://{0}:{1}/api/v2/'.format(*server.server_address)
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,308 @@
+"""
+Runs the client against an in-process fake API and writes the results as
+JSON, so that runs from different versions can be compared.
+
+    python benchmarks/suite.py --places 20000 --latency 0.002 --output new.json
+    python benchmarks/suite.py --compare old.json new.json
+
+Measures:
+
+- fetch_all: places/sec loading every page, one page at a time, with
+  ``--concurrency`` pages in flight, and one at a time with an
+  AdaptivePager aiming at ``--target-seconds`` per page.
+- decode: bytes/sec decoding one page of places with the codec.
+- hydrate: places/sec for ShareaboutsCollection.update on parsed pages.
+- save: saves/sec for bulk_save, sequential and concurrent.
+- serialize: seconds for ShareaboutsDataset.serialize, and for encoding it.
+- memory: peak and retained bytes while fetching every page (Python 3).
+- export: records/sec and bytes/sec streaming the dataset to a null file
+  as GeoJSON and as gzipped NDJSON, with the peak memory (Python 3).
+"""
+from __future__ import print_function, unicode_literals, division
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import shareabouts
+from shareabouts import AdaptivePager, ShareaboutsApi
+from shareabouts.codec import get_codec
+from shareabouts.stats import timer
+from fakeapi import start_fake_api
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+
+def new_dataset(server, options):
+    api = ShareaboutsApi(root=server.root, codec=get_codec(
+        options.codec, raw_geometry=options.raw_geometry))
+    return api.account('alice').dataset('demo')
+
+
+def bench_fetch_all(server, options):
+    results = {}
+    for concurrency in sorted(set([1, options.concurrency])):
+        dataset = new_dataset(server, options)
+        pages = count = 0
+        start = timer()
+        for page in dataset.places.fetch_all(concurrency=concurrency,
+                                             page_size=options.page_size):
+            pages += 1
+            count += len(page['features'])
+        elapsed = timer() - start
+        results['concurrency_{0}'.format(concurrency)] = {
+            'pages': pages,
+            'seconds': elapsed,
+            'places_per_sec': count / elapsed,
+        }
+
+    dataset = new_dataset(server, options)
+    pager = AdaptivePager(target_seconds=options.target_seconds)
+    pages = count = 0
+    start = timer()
+    for page in dataset.places.fetch_all(pager=pager, page_size=options.page_size):
+        pages += 1
+        count += len(page['features'])
+    elapsed = timer() - start
+    results['adaptive'] = {
+        'pages': pages,
+        'seconds': elapsed,
+        'places_per_sec': count / elapsed,
+        'max_page_size': max([options.page_size] + pager.sizes),
+    }
+    return results
+
+
+def bench_decode(server, options):
+    dataset = new_dataset(server, options)
+    codec = dataset.api().codec
+    url = dataset.places.url() + '?page_size={0}'.format(options.page_size)
+    body = dataset.api().send('GET', url).content
+
+    best = None
+    for _ in range(options.repeat):
+        start = timer()
+        codec.loads(body)
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {'bytes': len(body), 'seconds': best, 'bytes_per_sec': len(body) / best}
+
+
+def bench_hydrate(server, options):
+    dataset = new_dataset(server, options)
+    codec = dataset.api().codec
+    raw_pages = [codec.dumps(page['features']) for page in
+                 dataset.places.fetch_all(page_size=options.page_size)]
+
+    best = None
+    for _ in range(options.repeat):
+        pages = [codec.loads(raw_page) for raw_page in raw_pages]
+        places = new_dataset(server, options).places
+        start = timer()
+        for page in pages:
+            places.update(page)
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    count = sum(len(page) for page in pages)
+    return {'places': count, 'seconds': best, 'places_per_sec': count / best}
+
+
+def bench_save(server, options):
+    results = {}
+    for concurrency in sorted(set([1, options.concurrency])):
+        dataset = new_dataset(server, options)
+        dataset.places.fetch(page_size=options.saves)
+        places = list(dataset.places)[:options.saves]
+        for place in places:
+            place['description'] = 'Edited at {0}'.format(time.time())
+
+        report = dataset.places.bulk_save(places, concurrency=concurrency)
+        summary = report.stats
+        results['concurrency_{0}'.format(concurrency)] = {
+            'saves': summary['count'],
+            'errors': summary['errors'],
+            'seconds': summary['seconds'],
+            'saves_per_sec': summary['records_per_sec'],
+            'p50_seconds': summary['p50'],
+            'p99_seconds': summary['p99'],
+        }
+    return results
+
+
+def bench_serialize(server, options):
+    dataset = new_dataset(server, options)
+    for _ in dataset.places.fetch_all(concurrency=options.concurrency,
+                                      page_size=options.page_size):
+        pass
+
+    start = timer()
+    data = dataset.serialize()
+    serialize_seconds = timer() - start
+
+    start = timer()
+    encoded = dataset.api().codec.dumps(data)
+    encode_seconds = timer() - start
+
+    return {'places': len(data['places']), 'seconds': serialize_seconds,
+            'encode_seconds': encode_seconds, 'bytes': len(encoded)}
+
+
+def bench_memory(server, options):
+    if tracemalloc is None:
+        return None
+
+    gc.collect()
+    tracemalloc.start()
+    dataset = new_dataset(server, options)
+    count = sum(len(page['features']) for page in
+                dataset.places.fetch_all(page_size=options.page_size))
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'places': count, 'retained_bytes': current,
+            'peak_bytes': peak}
+
+
+class NullFile (object):
+    def write(self, data):
+        return len(data)
+
+
+def bench_export(server, options):
+    results = {}
+    for name, kwargs in [('geojson', {}),
+                         ('ndjson_gzip', {'format': 'ndjson', 'compress': True})]:
+        kwargs.update(concurrency=options.concurrency, page_size=options.page_size)
+        report = new_dataset(server, options).export(NullFile(), **kwargs)
+        results[name] = {'places': report.places, 'seconds': report.seconds,
+                         'records_per_sec': report.records_per_sec,
+                         'bytes_per_sec': report.bytes_per_sec}
+
+        # Measured on a second run, since tracing slows everything down.
+        if tracemalloc is not None:
+            gc.collect()
+            tracemalloc.start()
+            new_dataset(server, options).export(NullFile(), **kwargs)
+            results[name]['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return results
+
+
+BENCHMARKS = [
+    ('fetch_all', bench_fetch_all),
+    ('decode', bench_decode),
+    ('hydrate', bench_hydrate),
+    ('save', bench_save),
+    ('serialize', bench_serialize),
+    ('memory', bench_memory),
+    ('export', bench_export),
+]
+
+
+def run(options):
+    server = start_fake_api(places=options.places, padding=options.padding,
+                            latency=options.latency)
+    results = {}
+    try:
+        for name, bench in BENCHMARKS:
+            if options.only and name not in options.only:
+                continue
+            print('Running {0}...'.format(name), file=sys.stderr)
+            results[name] = bench(server, options)
+    finally:
+        server.shutdown()
+
+    return {
+        'version': shareabouts.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'codec': get_codec(options.codec).name,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'params': dict((key, value) for key, value in vars(options).items()
+                       if key not in ('output', 'compare')),
+        'results': results,
+    }
+
+
+def flatten(results, prefix=''):
+    for key, value in sorted(results.items()):
+        if isinstance(value, dict):
+            for item in flatten(value, prefix + key + '.'):
+                yield item
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + key, value
+
+
+def compare(old_path, new_path):
+    """
+    Prints the change in every metric from one results file to another.
+    Rates are better higher; times and sizes are better lower.
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    old_metrics = dict(flatten(old['results']))
+    print('{0:<45} {1:>14} {2:>14} {3:>8}'.format(
+        'metric', old['version'], new['version'], 'change'))
+    for key, value in flatten(new['results']):
+        before = old_metrics.get(key)
+        if not before:
+            continue
+        change = (value - before) / before
+        better = change > 0 if key.endswith('_per_sec') else change < 0
+        print('{0:<45} {1:>14.4g} {2:>14.4g} {3:>+7.1%}{4}'.format(
+            key, before, value, change, '' if abs(change) < 0.05 else (' +' if better else ' -')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--places', type=int, default=10000)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--padding', type=int, default=0,
+                        help='extra characters of text per place')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds the fake server waits before each response')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--target-seconds', type=float, default=0.5,
+                        help='page time the adaptive pager aims for')
+    parser.add_argument('--codec', choices=['orjson', 'ujson', 'json'],
+                        help='JSON backend (default: the fastest installed)')
+    parser.add_argument('--raw-geometry', action='store_true',
+                        help="don't decode place geometries")
+    parser.add_argument('--saves', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', action='append',
+                        choices=[name for name, _ in BENCHMARKS])
+    parser.add_argument('--output', help='file to write the results to')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two results files instead of running')
+    options = parser.parse_args(argv)
+
+    if options.compare:
+        compare(*options.compare)
+        return
+
+    results = run(options)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,8 @@ author = 'OpenPlans'
 author_email = 'mjumbewu@gmail.com'
 license = 'BSD'
 dependency_links = []
-install_requires = ['requests>=1.2']
+install_requires = ['requests>=1.2', 'futures; python_version < "3.0"']
+extras_require = {'async': ['aiohttp>=3.0']}
 
 
 def rel_path(path):
@@ -83,6 +84,7 @@ setup(
     package_data=get_package_data(package),
     dependency_links=dependency_links,
     install_requires=install_requires,
+    extras_require=extras_require,
     classifiers=[
         "Development Status :: 4 - Beta",
         "Environment :: Web Environment",
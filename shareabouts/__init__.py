@@ -1,4 +1,11 @@
 from .api import ShareaboutsApi
+from .cache import ResponseCache
+from .codec import get_codec
 from .exceptions import ShareaboutsApiException
+from .paging import AdaptivePager, Checkpoint
+from .retry import RetryPolicy, TokenBucket
+from .stats import MetricsCollector
+from .transport import PooledTransport, SimpleTransport
+from .writebehind import WriteBehindQueue
 
 __version__ = "2.0.0"
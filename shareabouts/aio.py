@@ -0,0 +1,250 @@
+"""
+An asyncio version of ShareaboutsApi, built on aiohttp.
+
+The account, dataset, place and submission objects are the same ones that
+ShareaboutsApi uses; instead of calling their blocking ``fetch``, ``save``
+and ``destroy`` methods, pass them to the awaitable methods of the same name
+on AsyncShareaboutsApi:
+
+    async with AsyncShareaboutsApi(root) as api:
+        dataset = api.account('alice').dataset('demo')
+        async for page in api.fetch_all(dataset.places):
+            ...
+"""
+from __future__ import unicode_literals
+
+import asyncio
+from collections import deque
+
+import aiohttp
+
+from shareabouts.api import ShareaboutsApi
+from shareabouts.codec import get_codec
+from shareabouts.exceptions import ShareaboutsApiException
+from shareabouts.models import ShareaboutsCollection
+from shareabouts.stats import timer
+
+
+class _NoTransport (object):
+    """
+    The transport of the ShareaboutsApi that an AsyncShareaboutsApi's models
+    hold. Their blocking methods (``fetch``, ``save``, ``destroy`` and the
+    rest) would block the event loop, so instead of sending requests it
+    raises an error saying what to await.
+    """
+    def request(self, method, url, **kwargs):
+        raise ShareaboutsApiException((
+              'Can not send {0} {1}: models of an AsyncShareaboutsApi can not '
+              'make blocking requests. Await the method of the same name on '
+              'the AsyncShareaboutsApi instead, as in "await api.fetch(obj)".'
+            ).format(method, url))
+
+    def close(self):
+        pass
+
+
+class AsyncShareaboutsApi (object):
+    """
+    Makes requests for models over aiohttp. The models themselves belong to
+    a ShareaboutsApi that the object holds, which builds their uris and the
+    request headers, and runs the hooks, but can't send requests.
+    """
+    def __init__(self, root='http://localhost:8000/api/v2/', limit=100,
+                 limit_per_host=0, timeout=None, session=None,
+                 partial_updates=None, codec=None):
+        self._api = ShareaboutsApi(root, transport=_NoTransport(),
+                                   partial_updates=partial_updates,
+                                   codec=codec or get_codec())
+        self.uri_root = root
+        self.codec = self._api.codec
+        self.accounts = self._api.accounts
+
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self._session = session
+        self._owns_session = session is None
+
+    def __str__(self):
+        return '<Async Shareabouts API object with root "{0}">'.format(self.uri_root)
+
+    @property
+    def partial_updates(self):
+        return self._api.partial_updates
+
+    @partial_updates.setter
+    def partial_updates(self, value):
+        self._api.partial_updates = value
+
+    def account(self, account_username):
+        return self._api.account(account_username)
+
+    def build_uri(self, name, *args, **kwargs):
+        return self._api.build_uri(name, *args, **kwargs)
+
+    def authenticate_with_django_request(self, request):
+        self._api.authenticate_with_django_request(request)
+
+    def authenticate_with_csrf_token(self, token, cookies):
+        self._api.authenticate_with_csrf_token(token, cookies)
+
+    def authenticate_with_key(self, key):
+        self._api.authenticate_with_key(key)
+
+    def authenticate_with_basic(self, username, password):
+        self._api.authenticate_with_basic(username, password)
+
+    def add_hook(self, event, hook):
+        self._api.add_hook(event, hook)
+
+    def remove_hook(self, event, hook):
+        self._api.remove_hook(event, hook)
+
+    def session(self):
+        # The session has to be created from within a running event loop.
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.limit_per_host)
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and self._owns_session:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def send(self, method, url, data=None):
+        """
+        Sends a request and returns a ``(status, body)`` pair, where body is
+        the undecoded response content.
+        """
+        if data is not None:
+            data = self.codec.dumps(data)
+
+        headers, auth = self._api.build_headers(method)
+        if auth is not None:
+            auth = aiohttp.BasicAuth(*auth)
+
+        hooks = self._api._hooks
+        if hooks is None:
+            async with self.session().request(method, url, data=data,
+                                              headers=headers, auth=auth) as response:
+                body = await response.read()
+                return response.status, body
+
+        info = {'method': method, 'url': url, 'template': self._api.template_name(url),
+                'request_bytes': len(data) if data is not None else 0}
+        self._api._emit(hooks, 'before_request', info)
+
+        start = timer()
+        try:
+            async with self.session().request(method, url, data=data,
+                                              headers=headers, auth=auth) as response:
+                ttfb = timer() - start
+                body = await response.read()
+        except Exception as e:
+            info.update(status=None, error=e, seconds=timer() - start)
+            self._api._emit(hooks, 'after_response', info)
+            raise
+
+        info.update(status=response.status, seconds=timer() - start,
+                    ttfb=ttfb, bytes=len(body))
+        self._api._emit(hooks, 'after_response', info)
+        return response.status, body
+
+    async def get(self, url, default=None):
+        """
+        Returns decoded data from a GET request, or default on non-200
+        responses.
+        """
+        status, body = await self.send('GET', url)
+        return (self._api._decode_content(url, body) if status == 200 else default)
+
+    async def send_and_parse(self, method, url, data=None, valid=[200]):
+        status, body = await self.send(method, url, data)
+        if status in valid:
+            return self._api._decode_content(url, body)
+        else:
+            raise ShareaboutsApiException((
+                  'Did not get a valid response from {0}. Instead, got a {1} '
+                  'with the text "{2}".'
+                ).format(url, status, body.decode('utf-8', 'replace')))
+
+    async def _get_parsed_data(self, url):
+        return await self.send_and_parse('GET', url)
+
+    # Model and collection operations
+    async def fetch(self, obj, url=None, **options):
+        """
+        Fetches a model, or one page of a collection. For a collection the
+        raw page data is returned, as with ``ShareaboutsCollection.fetch``.
+        """
+        if isinstance(obj, ShareaboutsCollection):
+            url = obj._page_url(url or obj.url(), options)
+            raw_data = await self._get_parsed_data(url)
+            return obj._load_page(raw_data)
+        else:
+            raw_data = await self._get_parsed_data(obj._fetch_url(options))
+            return obj._load_instance(raw_data)
+
+    async def fetch_all(self, collection, url=None, concurrency=1, **options):
+        """
+        Asynchronously iterates over every page of a collection, loading
+        each into the collection before yielding its raw data. With
+        ``concurrency`` greater than 1, up to that many pages after the
+        first are requested at once; they are still yielded in order.
+        """
+        page_url = url or collection.url()
+        options.setdefault('page_size', 250)
+
+        page_data = await self.fetch(collection, url=page_url, **options)
+        yield page_data
+        next_url = page_data[collection._metadata_attr].get('next')
+
+        if concurrency > 1 and next_url:
+            page_urls = collection._numbered_page_urls(next_url, collection.page_count)
+            pending = deque()
+            try:
+                for page_url in page_urls:
+                    pending.append(asyncio.ensure_future(self._get_parsed_data(page_url)))
+                    if len(pending) >= concurrency:
+                        yield collection._load_page(await pending.popleft())
+                while pending:
+                    yield collection._load_page(await pending.popleft())
+            finally:
+                for task in pending:
+                    task.cancel()
+            return
+
+        while next_url:
+            page_data = await self.fetch(collection, url=next_url, **options)
+            yield page_data
+            next_url = page_data[collection._metadata_attr].get('next')
+
+    async def save(self, inst):
+        request = inst._save_request()
+        if request is None:
+            return inst
+
+        method, url, send_data, valid = request
+        response_data = await self.send_and_parse(method, url, send_data, valid)
+        inst._load(response_data)
+        if inst.collection is not None:
+            inst.collection._reindex(inst)
+        return inst
+
+    async def destroy(self, inst):
+        if not inst.is_new():
+            await self.send('DELETE', inst.url())
+
+        if inst.collection is not None:
+            inst.collection.remove(inst)
+            inst.collection = None
@@ -1,25 +1,22 @@
 from __future__ import unicode_literals, division
 
-import json
 import math
-import requests
-import datetime
+import re
+from shareabouts.codec import ShareaboutsEncoder, get_codec
+from shareabouts.concurrency import SingleFlight
 from shareabouts.exceptions import ShareaboutsApiException
+from shareabouts.jsonstream import JSONResultsStream
 from shareabouts.models import ShareaboutsAccountSet
+from shareabouts.stats import EVENTS, timer
+from shareabouts.transport import PooledTransport
 
 try:
     # Python 2
     from urllib import urlencode
+    from urlparse import urlsplit
 except ImportError:
     # Python 3
-    from urllib.parse import urlencode
-
-
-class ShareaboutsEncoder (json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (datetime.date, datetime.datetime)):
-            return obj.isoformat()
-        return json.JSONEncoder.default(self, obj)
+    from urllib.parse import urlencode, urlsplit
 
 
 class ShareaboutsApi (object):
@@ -33,13 +30,109 @@ class ShareaboutsApi (object):
         'all_submissions_collection': r'{username}/datasets/{dataset_slug}/{set_name}',
     }
 
-    def __init__(self, root='http://localhost:8000/api/v2/'):
+    # Whether the server accepts PATCH requests, so that saving a model only
+    # has to send the fields that changed.
+    partial_updates = False
+
+    # Whether identical GETs made at the same time from several threads
+    # share one request. The callers then share the decoded data too, so
+    # they must not modify it.
+    coalesce_gets = False
+
+    # A RetryPolicy for failed requests, and a TokenBucket (possibly shared
+    # with other API objects) to limit the request rate.
+    retry = None
+    rate_limiter = None
+
+    # A WriteBehindQueue that model saves and deletes go through, so that
+    # they return at once and repeated saves of a model are combined.
+    write_behind = None
+
+    # Event name -> list of hooks; None while no hooks are registered.
+    _hooks = None
+
+    def __init__(self, root='http://localhost:8000/api/v2/', transport=None,
+                 cache=None, partial_updates=None, coalesce_gets=None,
+                 retry=None, rate_limiter=None, codec=None, write_behind=None):
         self.uri_root = root
+        self.transport = transport or PooledTransport()
+        self.codec = codec or get_codec()
+        self.cache = cache
+        self.flights = SingleFlight()
+        if partial_updates is not None:
+            self.partial_updates = partial_updates
+        if coalesce_gets is not None:
+            self.coalesce_gets = coalesce_gets
+        if retry is not None:
+            self.retry = retry
+        if rate_limiter is not None:
+            self.rate_limiter = rate_limiter
+        if write_behind is not None:
+            self.write_behind = write_behind
         self.accounts = ShareaboutsAccountSet(self)
 
     def __str__(self):
         return '<Shareabouts API object with root "{0}">'.format(self.uri_root)
 
+    def add_hook(self, event, hook):
+        """
+        Registers ``hook(event, info)`` to be called on an event, where info
+        is a dict with details such as the url, the uri template name, the
+        elapsed seconds, the byte count and the status. The events are:
+
+        - ``before_request``: a request is about to be sent.
+        - ``after_response``: the response headers arrived (with ``ttfb``)
+          and, unless streaming, its body was read. ``status`` is None and
+          ``error`` is set if the request failed.
+        - ``after_parse``: a response body was decoded from JSON.
+        - ``after_hydrate``: a page or a model from the server was loaded
+          into models (with the ``model`` class name and ``count``).
+        """
+        if event not in EVENTS:
+            raise ValueError('Unknown event {0!r}; expected one of {1}'.format(event, EVENTS))
+        hooks = dict(self._hooks or {})
+        hooks[event] = hooks.get(event, []) + [hook]
+        self._hooks = hooks
+
+    def remove_hook(self, event, hook):
+        hooks = dict(self._hooks or {})
+        remaining = [h for h in hooks.get(event, []) if h is not hook]
+        if remaining:
+            hooks[event] = remaining
+        else:
+            hooks.pop(event, None)
+        self._hooks = hooks or None
+
+    def _emit(self, hooks, event, info):
+        # Callers read _hooks once and pass it in, since another thread may
+        # remove the last hook, making it None, while a request is underway.
+        for hook in hooks.get(event, ()):
+            hook(event, info)
+
+    def template_name(self, url):
+        """
+        Returns the name of the entry in ``uri_templates`` that matches the
+        url, or 'other'.
+        """
+        if self.__dict__.get('_template_source') is not self.uri_templates:
+            # Match the templates with the most literal text first, so that
+            # '.../places' isn't taken for a submission set name.
+            root_path = urlsplit(self.uri_root).path
+            patterns = []
+            for name, template in self.uri_templates.items():
+                parts = re.split(r'\{[^}]*\}', template)
+                pattern = re.escape(root_path) + '[^/]+'.join(
+                    re.escape(part) for part in parts) + '/?$'
+                patterns.append((-len(''.join(parts)), name, re.compile(pattern)))
+            self._template_patterns = [(name, pattern) for _, name, pattern in sorted(patterns)]
+            self._template_source = self.uri_templates
+
+        path = urlsplit(url).path
+        for name, pattern in self._template_patterns:
+            if pattern.match(path):
+                return name
+        return 'other'
+
     def build_uri(self, name, *args, **kwargs):
         uri_template = self.uri_templates[name]
         uri_path = uri_template.format(*args, **kwargs)
@@ -59,10 +152,11 @@ class ShareaboutsApi (object):
     def authenticate_with_basic(self, username, password):
         self.auth = (username, password)
 
-    def send(self, method, url, data=None):
-        if data is not None:
-            data = json.dumps(data, cls=ShareaboutsEncoder)
-
+    def build_headers(self, method):
+        """
+        Returns the headers and basic auth credentials to send with a
+        request, based on how this API object has been authenticated.
+        """
         headers = {'Content-type': 'application/json',
                    'Accept': 'application/json'}
         auth = None
@@ -86,34 +180,190 @@ class ShareaboutsApi (object):
         if method == 'DELETE':
             headers.update({'Content-Length': '0'})
 
-        response = requests.request(method, url, 
-                                    data=data, headers=headers, auth=auth)
+        return headers, auth
+
+    def send(self, method, url, data=None, extra_headers=None, stream=False):
+        if data is not None:
+            data = self.codec.dumps(data)
+
+        headers, auth = self.build_headers(method)
+        if extra_headers:
+            headers.update(extra_headers)
+
+        # Anything but a GET may change what is at the url, and the
+        # collections above it
+        if self.cache is not None and method != 'GET':
+            self.cache.invalidate(url)
+
+        if self.retry is None and self.rate_limiter is None:
+            return self._request(method, url, data, headers, auth, stream)
+
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                response = self._request(method, url, data, headers, auth, stream)
+            except Exception as e:
+                delay = self.retry and self.retry.delay_for_error(method, attempt, e)
+                if delay is None:
+                    raise
+            else:
+                delay = self.retry and self.retry.delay_for_response(method, attempt, response)
+                if delay is None:
+                    return response
+                # Only the server's Retry-After holds back every thread; a
+                # backoff of our own is for this request alone.
+                if (response.status_code == 429 and self.rate_limiter is not None
+                        and self.retry.retry_after(response) is not None):
+                    self.rate_limiter.pause(delay)
+                response.close()
+
+            self.retry.count_retry()
+            self.retry.sleep(delay)
+            attempt += 1
+
+    def _request(self, method, url, data, headers, auth, stream):
+        hooks = self._hooks
+        if hooks is None:
+            return self.transport.request(method, url,
+                                          data=data, headers=headers, auth=auth,
+                                          stream=stream)
+
+        info = {'method': method, 'url': url, 'template': self.template_name(url),
+                'request_bytes': len(data) if data is not None else 0}
+        self._emit(hooks, 'before_request', info)
+
+        start = timer()
+        try:
+            response = self.transport.request(method, url,
+                                              data=data, headers=headers, auth=auth,
+                                              stream=stream)
+        except Exception as e:
+            info.update(status=None, error=e, seconds=timer() - start)
+            self._emit(hooks, 'after_response', info)
+            raise
+
+        # Reading the content here (rather than when it's first used) puts
+        # the download time into this event.
+        elapsed = getattr(response, 'elapsed', None)
+        length = response.headers.get('Content-Length') if stream else len(response.content)
+        info.update(status=response.status_code, seconds=timer() - start,
+                    ttfb=elapsed.total_seconds() if elapsed is not None else None,
+                    bytes=int(length) if length is not None else None)
+        self._emit(hooks, 'after_response', info)
         return response
 
+    def _decode(self, url, response):
+        return self._decode_content(url, response.content)
+
+    def _decode_content(self, url, content):
+        hooks = self._hooks
+        if hooks is None:
+            return self.codec.loads(content)
+
+        start = timer()
+        data = self.codec.loads(content)
+        self._emit(hooks, 'after_parse', {'url': url, 'template': self.template_name(url),
+                                          'seconds': timer() - start,
+                                          'bytes': len(content)})
+        return data
+
+    def _cached_get(self, url):
+        """
+        Performs a GET through the response cache, returning the status code,
+        the decoded data (for a 200) and the response (None if the server was
+        not contacted). A 304 from the server is reported as a 200.
+        """
+        cache = self.cache
+        entry = cache.lookup(url)
+
+        if entry is not None and entry.is_fresh():
+            cache.count_hit()
+            return 200, entry.data(), None
+
+        validators = entry.validators() if entry is not None else None
+        response = self.send('GET', url, extra_headers=validators)
+
+        if response.status_code == 304 and entry is not None:
+            cache.count_hit(revalidated=True)
+            cache.refresh(url, entry)
+            return 200, entry.data(), response
+
+        cache.count_miss()
+        if response.status_code == 200:
+            data = self._decode(url, response)
+            cache.store(url, response, data)
+            return 200, data, response
+        return response.status_code, None, response
+
+    def _invalid_response(self, url, response):
+        return ShareaboutsApiException((
+              'Did not get a valid response from {0}. Instead, got a {1} '
+              'with the text "{2}".'
+            ).format(url, response.status_code, response.text))
+
+    def _parsed_get(self, url):
+        """
+        Performs a GET, returning the status code, the decoded data (for a
+        200) and the response.
+        """
+        if self.cache is not None:
+            return self._cached_get(url)
+
+        response = self.send('GET', url)
+        if response.status_code == 200:
+            return 200, self._decode(url, response), response
+        return response.status_code, None, response
+
+    def _shared_get(self, url):
+        if self.coalesce_gets:
+            return self.flights.do(url, self._parsed_get, url)
+        return self._parsed_get(url)
+
     def get(self, url, default=None):
         """
         Returns decoded data from a GET request, or default on non-200
         responses.
         """
-        res = self.send('GET', url)
-        res_json = res.text
-        return (json.loads(res_json) if res.status_code == 200 else default)
+        status_code, data, _ = self._shared_get(url)
+        return (data if status_code == 200 else default)
 
     def send_and_parse(self, method, url, data=None, valid=[200]):
         response = self.send(method, url, data)
         if response.status_code in valid:
-            fetched_data = json.loads(response.text)
+            fetched_data = self._decode(url, response)
             return fetched_data
         else:
-            raise ShareaboutsApiException((
-                  'Did not get a valid response from {0}. Instead, got a {1} '
-                  'with the text "{2}".'
-                ).format(url, response.status_code, response.text))
+            raise self._invalid_response(url, response)
 
     def _get_parsed_data(self, url):
-        fetched_data = self.send_and_parse('GET', url)
+        status_code, fetched_data, response = self._shared_get(url)
+        if status_code != 200:
+            raise self._invalid_response(url, response)
         return fetched_data
 
+    def _stream_results(self, url, results_attr, chunk_size=64 * 1024):
+        """
+        GETs a page and decodes it incrementally from the response stream.
+        Returns a JSONResultsStream over the page's results; the rest of the
+        page is available in its ``document`` once it has been consumed.
+        """
+        response = self.send('GET', url, stream=True)
+        if response.status_code != 200:
+            raise self._invalid_response(url, response)
+
+        def chunks():
+            try:
+                for chunk in response.iter_content(chunk_size):
+                    yield chunk
+            finally:
+                response.close()
+
+        return JSONResultsStream(chunks(), results_attr,
+                                 response.encoding or 'utf-8')
+
     def account(self, account_username):
         owner = self.accounts.get(account_username)
         if owner is None:
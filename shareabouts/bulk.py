@@ -0,0 +1,95 @@
+from __future__ import unicode_literals
+
+from shareabouts.concurrency import bounded_imap
+from shareabouts.stats import LatencyStats, timer
+
+
+class BulkReport (object):
+    """
+    The outcome of a bulk operation. ``results`` lines up with the items
+    that were submitted; each entry is either the saved instance or the
+    exception raised while saving it (usually a ShareaboutsApiException).
+    Items that needed no request are listed in ``skipped``, and not in
+    ``succeeded``.
+    """
+    def __init__(self, results, stats, skipped=()):
+        self.results = results
+        self.stats = stats
+        self.skipped = list(skipped)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def succeeded(self):
+        skipped = set(id(item) for item in self.skipped)
+        return [r for r in self.results
+                if not isinstance(r, Exception) and id(r) not in skipped]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if isinstance(r, Exception)]
+
+    def __str__(self):
+        return '<BulkReport {0} ok, {1} skipped, {2} failed>'.format(
+            len(self.succeeded), len(self.skipped), len(self.failed))
+
+
+def is_unchanged(inst):
+    # A saved model with no changes, which save() would skip. Anything else
+    # is left to fail (or not) in func.
+    is_dirty = getattr(inst, 'is_dirty', None)
+    return is_dirty is not None and inst.has_key() and not is_dirty()
+
+
+def run_bulk(func, items, concurrency, on_success=None, skip=None):
+    """
+    Calls ``func`` on every item over a pool of ``concurrency`` threads.
+    An exception from one item (a ShareaboutsApiException, or a connection
+    error from the transport) is recorded as its result rather than
+    stopping the batch. ``on_success`` is called on the consuming
+    thread with each item that succeeded.
+
+    Items for which ``skip(item)`` is true are not passed to ``func``; they
+    count as skipped, not as (near instant) successes in the stats, though
+    ``on_success`` is still called with them.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    stats = LatencyStats()
+
+    def timed(indexed_item):
+        index, item = indexed_item
+        start = timer()
+        try:
+            func(item)
+        except Exception as e:
+            stats.record(timer() - start, error=True)
+            return e
+        stats.record(timer() - start)
+        return item
+
+    stats.start()
+    pending, skipped = [], []
+    for index, item in enumerate(items):
+        if skip is not None and skip(item):
+            stats.skip()
+            skipped.append(item)
+            results[index] = item
+            if on_success is not None:
+                on_success(item)
+        else:
+            pending.append((index, item))
+
+    for (index, item), future in bounded_imap(timed, pending,
+                                              concurrency, ordered=False):
+        result = future.result()
+        results[index] = result
+        if on_success is not None and result is item:
+            on_success(item)
+    stats.stop()
+
+    return BulkReport(results, stats.summary(), skipped)
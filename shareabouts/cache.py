@@ -0,0 +1,169 @@
+from __future__ import unicode_literals
+
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheEntry (object):
+    __slots__ = ('packed', 'etag', 'last_modified', 'expires')
+
+    def __init__(self, packed, etag, last_modified, expires):
+        self.packed = packed
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    @property
+    def size(self):
+        return len(self.packed)
+
+    def data(self):
+        return pickle.loads(self.packed)
+
+    def is_fresh(self, now=None):
+        return (now or time.time()) < self.expires
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache (object):
+    """
+    A size-bounded, least-recently-used cache of parsed GET responses, for
+    use with ``ShareaboutsApi(cache=...)``.
+
+    Parsed data is kept pickled, which both gives an exact byte count for
+    the ``max_bytes`` limit and hands every caller its own copy, so models
+    can't alter what is in the cache.
+
+    An entry younger than its TTL is returned without contacting the
+    server. An older entry is revalidated with ``If-None-Match`` and
+    ``If-Modified-Since``, and reused if the server answers 304. The default
+    ``ttl`` of 0 revalidates on every request. ``ttl_overrides`` is a list
+    of ``(pattern, seconds)`` pairs; the first pattern that matches the url
+    (with ``re.search``) decides its TTL.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=0, ttl_overrides=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.ttl_overrides = [(re.compile(pattern), seconds)
+                              for pattern, seconds in (ttl_overrides or [])]
+
+        self._entries = OrderedDict()
+        self._urls_by_path = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_ttl(self, pattern, seconds):
+        self.ttl_overrides.insert(0, (re.compile(pattern), seconds))
+
+    def ttl_for(self, url):
+        for pattern, seconds in self.ttl_overrides:
+            if pattern.search(url):
+                return seconds
+        return self.ttl
+
+    def lookup(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                # Mark the entry as most recently used
+                del self._entries[url]
+                self._entries[url] = entry
+            return entry
+
+    def store(self, url, response, data):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        ttl = self.ttl_for(url)
+
+        # Without validators or a TTL the entry could never be used again.
+        if not (etag or last_modified or ttl):
+            return
+
+        packed = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        if len(packed) > self.max_bytes:
+            return
+
+        entry = CacheEntry(packed, etag, last_modified, time.time() + ttl)
+        with self._lock:
+            self._discard(url)
+            self._entries[url] = entry
+            self._urls_by_path.setdefault(url.split('?', 1)[0], set()).add(url)
+            self.current_bytes += entry.size
+
+            while self.current_bytes > self.max_bytes:
+                evicted_url = next(iter(self._entries))
+                self._discard(evicted_url)
+                self.evictions += 1
+
+    def refresh(self, url, entry):
+        entry.expires = time.time() + self.ttl_for(url)
+
+    def invalidate(self, url):
+        """
+        Drops the entries for a url and for each path above it, so that a
+        change to a place also drops the cached pages of its collection,
+        along with any cached with a query string on the same paths.
+        """
+        with self._lock:
+            path = url.split('?', 1)[0].rstrip('/')
+            # Stop at the scheme and host.
+            while path.count('/') > 2:
+                for key in (path, path + '/'):
+                    for cached_url in list(self._urls_by_path.get(key, ())):
+                        self._discard(cached_url)
+                path = path.rsplit('/', 1)[0]
+
+    def count_hit(self, revalidated=False):
+        with self._lock:
+            self.hits += 1
+            if revalidated:
+                self.revalidations += 1
+
+    def count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._urls_by_path.clear()
+            self.current_bytes = 0
+
+    def _discard(self, url):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self.current_bytes -= entry.size
+
+            path = url.split('?', 1)[0]
+            urls = self._urls_by_path[path]
+            urls.discard(url)
+            if not urls:
+                del self._urls_by_path[path]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'hits': self.hits,
+                'revalidations': self.revalidations,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
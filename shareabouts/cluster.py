@@ -0,0 +1,199 @@
+from __future__ import unicode_literals, division
+
+import math
+
+from shareabouts.spatial import geometry_bbox
+
+
+MAX_LATITUDE = 85.0511287798
+
+
+def mercator(lon, lat):
+    """
+    Projects a lon/lat pair to Web Mercator, normalized so that the world
+    spans 0..1 on both axes (y grows southward, as with map tiles).
+    """
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    x = (lon + 180) / 360
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+
+
+class _Cluster (object):
+    __slots__ = ('count', 'sum_x', 'sum_y', 'ids')
+
+    def __init__(self):
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.ids = []
+
+
+class GridClusterer (object):
+    """
+    Groups places into grid clusters for every zoom level from ``min_zoom``
+    to ``max_zoom``, using the same tiling as web maps. Use it as a
+    collection index:
+
+        clusterer = places.add_index(GridClusterer())
+        clusterer.tile(12, 1192, 1551)
+
+    Each map tile is divided into ``cells_per_tile`` x ``cells_per_tile``
+    cells (which should be a power of two). A cell at one zoom level is
+    made of exactly four cells at the next, so a place is assigned a cell
+    once, at ``max_zoom``, and every coarser cell is found by bit shifting.
+    Adding or removing a place touches one cell per level.
+
+    A cluster records its count, the centroid of its places, and up to
+    ``max_ids`` representative place ids. Cells at ``max_zoom`` keep the ids
+    of all their places, so that a cluster whose representatives are removed
+    can take new ones from the cells beneath it. Tiles beyond ``max_zoom``
+    are answered from the ``max_zoom`` cells that they overlap.
+    """
+    def __init__(self, min_zoom=0, max_zoom=16, cells_per_tile=4, max_ids=5):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.cells_per_tile = cells_per_tile
+        self.max_ids = max_ids
+
+        self._tile_shift = int(math.log(cells_per_tile, 2))
+        self._scale = (2 ** max_zoom) * cells_per_tile
+        # zoom -> (tx, ty) -> (cx, cy) -> _Cluster
+        self._levels = dict((zoom, {}) for zoom in range(min_zoom, max_zoom + 1))
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _point_of(self, inst):
+        bbox = geometry_bbox(inst.get('geometry'))
+        if bbox is None:
+            return None
+        return (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+
+    def add(self, inst):
+        self.discard(inst)
+
+        point = self._point_of(inst)
+        if point is None:
+            return
+
+        lon, lat = point
+        mx, my = mercator(lon, lat)
+        cx = min(int(mx * self._scale), self._scale - 1)
+        cy = min(int(my * self._scale), self._scale - 1)
+        inst_id = inst.key()
+
+        for zoom, tiles in self._levels.items():
+            shift = self.max_zoom - zoom
+            cell = (cx >> shift, cy >> shift)
+            tile = (cell[0] >> self._tile_shift, cell[1] >> self._tile_shift)
+            cluster = tiles.setdefault(tile, {}).get(cell)
+            if cluster is None:
+                cluster = tiles[tile][cell] = _Cluster()
+
+            cluster.count += 1
+            cluster.sum_x += lon
+            cluster.sum_y += lat
+            if inst_id is not None and (zoom == self.max_zoom or
+                                        len(cluster.ids) < self.max_ids):
+                cluster.ids.append(inst_id)
+
+        self._entries[id(inst)] = (cx, cy, lon, lat, inst_id)
+
+    def discard(self, inst):
+        entry = self._entries.pop(id(inst), None)
+        if entry is None:
+            return
+
+        cx, cy, lon, lat, inst_id = entry
+        # From the finest level up, so that a cluster's representatives can
+        # be refilled from the cells beneath it.
+        for zoom in range(self.max_zoom, self.min_zoom - 1, -1):
+            tiles = self._levels[zoom]
+            shift = self.max_zoom - zoom
+            cell = (cx >> shift, cy >> shift)
+            tile = (cell[0] >> self._tile_shift, cell[1] >> self._tile_shift)
+            cells = tiles[tile]
+            cluster = cells[cell]
+
+            cluster.count -= 1
+            cluster.sum_x -= lon
+            cluster.sum_y -= lat
+            if inst_id in cluster.ids:
+                cluster.ids.remove(inst_id)
+                if cluster.count > len(cluster.ids) and zoom < self.max_zoom:
+                    self._refill(zoom, cell, cluster)
+
+            if cluster.count == 0:
+                del cells[cell]
+                if not cells:
+                    del tiles[tile]
+
+    def _refill(self, zoom, cell, cluster):
+        # Takes representatives from the four cells at the next zoom level.
+        tiles = self._levels[zoom + 1]
+        for dx in (0, 1):
+            for dy in (0, 1):
+                child = (cell[0] * 2 + dx, cell[1] * 2 + dy)
+                tile = (child[0] >> self._tile_shift, child[1] >> self._tile_shift)
+                child_cluster = tiles.get(tile, {}).get(child)
+                if child_cluster is None:
+                    continue
+                for inst_id in child_cluster.ids:
+                    if len(cluster.ids) >= self.max_ids:
+                        return
+                    if inst_id not in cluster.ids:
+                        cluster.ids.append(inst_id)
+
+    def tile(self, zoom, x, y):
+        """
+        Returns the clusters in map tile ``x``, ``y`` at ``zoom``, as dicts
+        with ``count``, ``centroid`` ([lon, lat]) and ``ids``.
+        """
+        if zoom > self.max_zoom:
+            return self._subtile(zoom, x, y)
+
+        if zoom < self.min_zoom:
+            # The tile is made of several at min_zoom.
+            shift = self.min_zoom - zoom
+            return [cluster for tx in range(x << shift, (x + 1) << shift)
+                    for ty in range(y << shift, (y + 1) << shift)
+                    for cluster in self.tile(self.min_zoom, tx, ty)]
+
+        cells = self._levels[zoom].get((x, y), {})
+        return [self._summary(cluster) for cluster in cells.values()]
+
+    def _subtile(self, zoom, x, y):
+        # The tile is part of one at max_zoom; keep the cells of that tile
+        # that overlap it, measured in cells at the tile's zoom.
+        shift = zoom - self.max_zoom
+        cells = self._levels[self.max_zoom].get((x >> shift, y >> shift), {})
+        x0, y0 = x * self.cells_per_tile, y * self.cells_per_tile
+        x1, y1 = x0 + self.cells_per_tile, y0 + self.cells_per_tile
+        return [self._summary(cluster) for (cx, cy), cluster in cells.items()
+                if (cx << shift) < x1 and ((cx + 1) << shift) > x0 and
+                (cy << shift) < y1 and ((cy + 1) << shift) > y0]
+
+    def _summary(self, cluster):
+        return {'count': cluster.count,
+                'centroid': [cluster.sum_x / cluster.count,
+                             cluster.sum_y / cluster.count],
+                'ids': cluster.ids[:self.max_ids]}
+
+    def clusters(self, zoom, minx, miny, maxx, maxy):
+        """
+        Returns the clusters of every tile at ``zoom`` that intersects the
+        given lon/lat bounding box.
+        """
+        zoom = max(min(zoom, self.max_zoom), self.min_zoom)
+        tiles_across = 2 ** zoom
+        x0, y0 = mercator(minx, maxy)
+        x1, y1 = mercator(maxx, miny)
+
+        results = []
+        for tx in range(int(x0 * tiles_across), min(int(x1 * tiles_across), tiles_across - 1) + 1):
+            for ty in range(int(y0 * tiles_across), min(int(y1 * tiles_across), tiles_across - 1) + 1):
+                results.extend(self.tile(zoom, tx, ty))
+        return results
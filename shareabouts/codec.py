@@ -0,0 +1,222 @@
+"""
+JSON codecs for ShareaboutsApi. A codec turns response bytes into Python
+data and request data into bytes:
+
+    api = ShareaboutsApi(root, codec=get_codec('orjson'))
+
+By default the API uses the fastest backend that is installed: orjson,
+then ujson, then the standard library. Every codec encodes dates and
+datetimes as ISO 8601 strings.
+
+With ``raw_geometry=True``, the ``geometry`` of each feature is not decoded
+but kept as a RawJSON (the undecoded bytes). For pages of lines or polygons
+that saves most of the parsing time, for consumers that only pass the
+geometries through; for points it costs more than it saves. Spatial
+indexes, clustering and CompactPlaceSet need decoded geometries, so don't
+combine them with it.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class RawJSON (bytes):
+    """
+    An undecoded JSON value, as UTF-8 bytes.
+    """
+    def load(self):
+        return json.loads(self.decode('utf-8'))
+
+
+class ShareaboutsEncoder (json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (datetime.date, datetime.datetime)):
+            return obj.isoformat()
+        if isinstance(obj, RawJSON):
+            return obj.load()
+        return json.JSONEncoder.default(self, obj)
+
+
+# Finds a geometry member. The value is matched whole when it is a flat
+# object (any geometry type but GeometryCollection); otherwise only its
+# start is, and the end is found by counting braces outside of strings.
+GEOMETRY = re.compile(br'"geometry"\s*:\s*(?:(\{[^{}"]*(?:"[^"\\{}]*"[^{}"]*)*\})|(?=\{))')
+BRACES = re.compile(br'"(?:[^"\\]|\\.)*"|[{}]')
+
+
+def _object_end(data, start):
+    depth = 0
+    for token in BRACES.finditer(data, start):
+        if token.group() == b'{':
+            depth += 1
+        elif token.group() == b'}':
+            depth -= 1
+            if depth == 0:
+                return token.end()
+    raise ValueError('Unterminated geometry at position {0}'.format(start))
+
+
+def _split_geometries(data):
+    """
+    Replaces each geometry object in the JSON bytes with its index in a
+    list of the raw geometries, returning the new bytes and the list.
+    """
+    pieces, geometries = [], []
+    pos = 0
+    for match in GEOMETRY.finditer(data):
+        if match.group(1) is not None:
+            start, end = match.span(1)
+        else:
+            start = match.end()
+            if start < pos:
+                # A "geometry" key inside a geometry we already took.
+                continue
+            end = _object_end(data, start)
+
+        pieces.append(data[pos:start])
+        pieces.append(str(len(geometries)).encode('ascii'))
+        geometries.append(RawJSON(data[start:end]))
+        pos = end
+
+    if not geometries:
+        return data, geometries
+    pieces.append(data[pos:])
+    return b''.join(pieces), geometries
+
+
+def _restore_geometries(data, geometries):
+    # Geometries are members of a feature, which is either the document
+    # itself or an item of one of its lists (features, results, places).
+    features = [data] if isinstance(data, dict) else data
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, list):
+                features = features + value
+
+    for feature in features:
+        if isinstance(feature, dict):
+            index = feature.get('geometry')
+            if isinstance(index, int) and not isinstance(index, bool):
+                feature['geometry'] = geometries[index]
+    return data
+
+
+class JSONCodec (object):
+    """
+    Decodes and encodes with the standard library's json module.
+    """
+    name = 'json'
+
+    def __init__(self, raw_geometry=False):
+        self.raw_geometry = raw_geometry
+
+    def loads(self, data):
+        """
+        Decodes JSON from bytes (or text).
+        """
+        if self.raw_geometry:
+            if not isinstance(data, bytes):
+                data = data.encode('utf-8')
+            data, geometries = _split_geometries(data)
+            if geometries:
+                return _restore_geometries(self._loads(data), geometries)
+        return self._loads(data)
+
+    def dumps(self, obj):
+        """
+        Encodes data as JSON bytes.
+        """
+        return self._dumps(obj)
+
+    def _loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+    def _dumps(self, obj):
+        return json.dumps(obj, cls=ShareaboutsEncoder).encode('utf-8')
+
+
+class OrjsonCodec (JSONCodec):
+    """
+    Decodes and encodes with orjson, which parses bytes directly and
+    encodes dates and datetimes natively. Note that orjson decodes integers
+    beyond 64 bits as floats.
+    """
+    name = 'orjson'
+
+    def _loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than the standard library (it rejects
+            # integers beyond 64 bits, for one).
+            return JSONCodec._loads(self, data)
+
+    def _dumps(self, obj):
+        try:
+            return orjson.dumps(obj, default=self._default,
+                                option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return JSONCodec._dumps(self, obj)
+
+    def _default(self, obj):
+        if isinstance(obj, RawJSON):
+            # Newer versions of orjson can write the bytes out verbatim.
+            fragment = getattr(orjson, 'Fragment', None)
+            return fragment(bytes(obj)) if fragment else obj.load()
+        raise TypeError
+
+
+class UjsonCodec (JSONCodec):
+    """
+    Decodes and encodes with ujson.
+    """
+    name = 'ujson'
+
+    def _loads(self, data):
+        try:
+            return ujson.loads(data)
+        except ValueError:
+            return JSONCodec._loads(self, data)
+
+    def _dumps(self, obj):
+        try:
+            return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+        except (TypeError, OverflowError):
+            # ujson can't encode dates (or RawJSON) itself.
+            return JSONCodec._dumps(self, obj)
+
+
+CODECS = [
+    ('orjson', orjson, OrjsonCodec),
+    ('ujson', ujson, UjsonCodec),
+    ('json', json, JSONCodec),
+]
+
+
+def get_codec(name=None, raw_geometry=False):
+    """
+    Returns a codec for the named backend, or for the fastest installed
+    backend if no name is given.
+    """
+    for codec_name, module, codec_class in CODECS:
+        if module is None:
+            if codec_name == name:
+                raise ImportError('{0} is not installed'.format(name))
+            continue
+        if name is None or codec_name == name:
+            return codec_class(raw_geometry=raw_geometry)
+    raise ValueError('Unknown codec {0!r}'.format(name))
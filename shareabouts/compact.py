@@ -0,0 +1,594 @@
+"""
+Compact, column-oriented storage for large place collections.
+
+A CompactPlaceSet keeps point coordinates in two ``array('d')`` columns and
+each property in a column list shared by every place, with property names
+and short string values interned. Places are handed out as thin
+CompactPlace views over a row, created on demand and dropped once nothing
+references them (views that carry unsaved edits or loaded submission sets
+are kept). Use it for a dataset with:
+
+    ShareaboutsDataset._place_set_class = CompactPlaceSet
+
+or by replacing a single dataset's ``places``.
+"""
+from __future__ import unicode_literals
+
+import math
+import weakref
+from array import array
+
+try:
+    from collections.abc import Mapping, MutableMapping, Sequence
+except ImportError:
+    # Python 2
+    from collections import Mapping, MutableMapping, Sequence
+
+try:
+    from sys import intern
+except ImportError:
+    # Python 2 has intern as a builtin
+    pass
+
+from shareabouts.bulk import is_unchanged, run_bulk
+from shareabouts.models import ShareaboutsPlace, ShareaboutsPlaceSet
+
+
+class _Missing (object):
+    # Pickles as a reference to _MISSING, so that pages of columns built in
+    # other processes can be appended as they are.
+    def __reduce__(self):
+        return '_MISSING'
+
+    def __repr__(self):
+        return '<missing>'
+
+# Marks an empty cell in a property column (None is a legitimate value).
+_MISSING = _Missing()
+
+# Marks the id of a removed row.
+_DELETED = object()
+
+# Only string values at most this long are interned.
+INTERN_MAX_LENGTH = 64
+
+NAN = float('nan')
+
+
+def _intern_value(value):
+    if isinstance(value, str) and len(value) <= INTERN_MAX_LENGTH:
+        return intern(value)
+    return value
+
+
+def _point_of(geometry):
+    # The (x, y) of a plain Point geometry, or None.
+    coords = geometry.get('coordinates') if geometry else None
+    if (geometry and geometry.get('type') == 'Point' and len(geometry) == 2
+            and coords is not None and len(coords) == 2):
+        return coords
+    return None
+
+
+class PlaceColumns (object):
+    """
+    A page of places in the column layout of a CompactPlaceSet: a list of
+    ids, arrays of point coordinates (NaN where a place's geometry isn't a
+    point), other geometries and extra top-level members by position, and a
+    list per property. Made by ``normalize_places``; it pickles compactly,
+    and a CompactPlaceSet appends it without handling each place.
+    """
+    def __init__(self, ids, xs, ys, geometries, columns, extras):
+        self.ids = ids
+        self.xs = xs
+        self.ys = ys
+        self.geometries = geometries
+        self.columns = columns
+        self.extras = extras
+
+    def __len__(self):
+        return len(self.ids)
+
+    def records(self):
+        """
+        Yields each place as a flat dict of its id, ``x`` and ``y`` (None
+        unless its geometry is a point) and properties.
+        """
+        columns = list(self.columns.items())
+        for i, inst_id in enumerate(self.ids):
+            x = self.xs[i]
+            record = {'id': inst_id,
+                      'x': None if math.isnan(x) else x,
+                      'y': None if math.isnan(x) else self.ys[i]}
+            for key, column in columns:
+                if column[i] is not _MISSING:
+                    record[key] = column[i]
+            yield record
+
+    def features(self):
+        """
+        Yields each place as a GeoJSON feature.
+        """
+        columns = list(self.columns.items())
+        for i, inst_id in enumerate(self.ids):
+            x = self.xs[i]
+            feature = {'type': 'Feature',
+                       'geometry': (self.geometries.get(i) if math.isnan(x) else
+                                    {'type': 'Point', 'coordinates': [x, self.ys[i]]}),
+                       'properties': dict((key, column[i]) for key, column in columns
+                                          if column[i] is not _MISSING)}
+            if inst_id is not None:
+                feature['id'] = inst_id
+            feature.update(self.extras.get(i, {}))
+            yield feature
+
+
+def normalize_places(features):
+    """
+    Returns the place features as PlaceColumns.
+    """
+    count = len(features)
+    ids, xs, ys = [], array('d'), array('d')
+    geometries, columns, extras = {}, {}, {}
+
+    for i, feature in enumerate(features):
+        ids.append(feature.get('id'))
+
+        geometry = feature.get('geometry')
+        point = _point_of(geometry)
+        if point is not None:
+            xs.append(point[0])
+            ys.append(point[1])
+        else:
+            xs.append(NAN)
+            ys.append(NAN)
+            geometries[i] = geometry
+
+        for key, value in (feature.get('properties') or {}).items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[_intern_value(key)] = [_MISSING] * count
+            column[i] = _intern_value(value)
+
+        for key, value in feature.items():
+            if key not in ('type', 'id', 'geometry', 'properties'):
+                extras.setdefault(i, {})[key] = value
+
+    return PlaceColumns(ids, xs, ys, geometries, columns, extras)
+
+
+class _RowProperties (MutableMapping):
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, key):
+        column = self.store._columns.get(key)
+        value = _MISSING if column is None else column[self.row]
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store._set_property(self.row, key, value)
+
+    def __delitem__(self, key):
+        column = self.store._columns.get(key)
+        if column is None or column[self.row] is _MISSING:
+            raise KeyError(key)
+        column[self.row] = _MISSING
+
+    def __iter__(self):
+        row = self.row
+        for key, column in self.store._columns.items():
+            if column[row] is not _MISSING:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def copy(self):
+        return dict(self)
+
+
+class _RowData (MutableMapping):
+    """
+    A GeoJSON Feature-shaped mapping over one row of a CompactPlaceSet.
+    The geometry is rebuilt on each access, so change it by assigning a new
+    geometry rather than by editing the returned one in place.
+    """
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, key):
+        store, row = self.store, self.row
+        if key == 'type':
+            return 'Feature'
+        elif key == 'id':
+            value = store._ids[row]
+            if value is None or value is _DELETED:
+                raise KeyError(key)
+            return value
+        elif key == 'geometry':
+            return store._geometry(row)
+        elif key == 'properties':
+            return _RowProperties(store, row)
+        return store._extras[row][key]
+
+    def __setitem__(self, key, value):
+        store, row = self.store, self.row
+        if key == 'type':
+            return
+        elif key == 'id':
+            store._set_id(row, value)
+        elif key == 'geometry':
+            store._set_geometry(row, value)
+        elif key == 'properties':
+            store._set_properties(row, value)
+        else:
+            store._extras.setdefault(row, {})[key] = value
+
+    def __delitem__(self, key):
+        store, row = self.store, self.row
+        if key == 'id':
+            store._set_id(row, None)
+        elif key == 'geometry':
+            store._set_geometry(row, None)
+        elif key == 'properties':
+            store._set_properties(row, {})
+        elif key != 'type':
+            extras = store._extras.get(row, {})
+            del extras[key]
+            if not extras:
+                store._extras.pop(row, None)
+
+    def __iter__(self):
+        yield 'type'
+        if self.store._ids[self.row] not in (None, _DELETED):
+            yield 'id'
+        yield 'geometry'
+        yield 'properties'
+        for key in self.store._extras.get(self.row, ()):
+            yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def clear(self):
+        # Keeps the id, which identifies the row in the collection.
+        self.store._set_geometry(self.row, None)
+        self.store._set_properties(self.row, {})
+        self.store._extras.pop(self.row, None)
+
+    def copy(self):
+        return self.store._row_dict(self.row)
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+class CompactPlace (ShareaboutsPlace):
+    """
+    A ShareaboutsPlace whose data lives in a row of a CompactPlaceSet.
+    """
+    def _pin(self):
+        # Keep views that carry state the row can't hold.
+        data = self._data
+        if isinstance(data, _RowData):
+            data.store._pinned[data.row] = self
+
+    def _mark_clean(self):
+        super(CompactPlace, self)._mark_clean()
+        data = self._data
+        if isinstance(data, _RowData) and '_submissions' not in self.__dict__:
+            data.store._pinned.pop(data.row, None)
+
+    @property
+    def submissions(self):
+        self._pin()
+        return ShareaboutsPlace.submissions.fget(self)
+
+    def mark_changed(self, *keys):
+        super(CompactPlace, self).mark_changed(*keys)
+        self._pin()
+
+    def __setitem__(self, key, value):
+        super(CompactPlace, self).__setitem__(key, value)
+        self._pin()
+
+    def __delitem__(self, key):
+        super(CompactPlace, self).__delitem__(key)
+        self._pin()
+
+    def update(self, other_data):
+        super(CompactPlace, self).update(other_data)
+        self._pin()
+
+    def clear(self):
+        super(CompactPlace, self).clear()
+        self._pin()
+
+
+class _RowViews (Sequence):
+    """
+    The places of a CompactPlaceSet (or of some of its rows), as a sequence
+    of views created on access.
+    """
+    def __init__(self, store, rows=None):
+        self.store = store
+        self.rows = rows
+
+    def _rows(self):
+        return self.rows if self.rows is not None else self.store._live_rows()
+
+    def __getitem__(self, index):
+        rows = self._rows()
+        if isinstance(index, slice):
+            return [self.store._view(row) for row in rows[index]]
+        return self.store._view(rows[index])
+
+    def __iter__(self):
+        view = self.store._view
+        for row in self._rows():
+            yield view(row)
+
+    def __len__(self):
+        return len(self._rows())
+
+
+class _IdViews (Mapping):
+    """
+    The places of a CompactPlaceSet by id, as views created on access.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, inst_id):
+        return self.store._view(self.store._rows[inst_id])
+
+    def __contains__(self, inst_id):
+        return inst_id in self.store._rows
+
+    def __iter__(self):
+        return iter(self.store._rows)
+
+    def __len__(self):
+        return len(self.store._rows)
+
+
+class CompactPlaceSet (ShareaboutsPlaceSet):
+    _model_class = CompactPlace
+
+    def __init__(self, api_proxy, dataset):
+        self._ids = []
+        self._rows = {}
+        self._xs = array('d')
+        self._ys = array('d')
+        self._geometries = {}
+        self._extras = {}
+        self._columns = {}
+        self._views = weakref.WeakValueDictionary()
+        self._pinned = {}
+        self._live = None
+        super(CompactPlaceSet, self).__init__(api_proxy, dataset)
+
+        self._data = _RowViews(self)
+        self._data_by_id = _IdViews(self)
+
+    def __len__(self):
+        return len(self._live_rows())
+
+    # Row storage
+    def _live_rows(self):
+        if self._live is None:
+            self._live = [row for row, inst_id in enumerate(self._ids)
+                          if inst_id is not _DELETED]
+        return self._live
+
+    def _append_row(self, inst_data):
+        row = len(self._ids)
+        self._ids.append(None)
+        self._xs.append(NAN)
+        self._ys.append(NAN)
+        for column in self._columns.values():
+            column.append(_MISSING)
+        if self._live is not None:
+            self._live.append(row)
+
+        self._write_row(row, inst_data)
+        return row
+
+    def _append_columns(self, page):
+        """
+        Appends a page of PlaceColumns as new rows, and returns the rows.
+        Places that are already in the collection (or that need indexing)
+        are added one at a time instead.
+        """
+        ids = [inst_id for inst_id in page.ids if inst_id is not None]
+        if (self._indexes or len(set(ids)) != len(ids) or
+                any(inst_id in self._rows for inst_id in ids)):
+            return [self._row_of(self.add(feature)) for feature in page.features()]
+
+        start, count = len(self._ids), len(page)
+        self._ids.extend(page.ids)
+        for i, inst_id in enumerate(page.ids):
+            if inst_id is not None:
+                self._rows[inst_id] = start + i
+        self._xs.extend(page.xs)
+        self._ys.extend(page.ys)
+        for i, geometry in page.geometries.items():
+            self._geometries[start + i] = geometry
+        for i, extras in page.extras.items():
+            self._extras[start + i] = extras
+
+        for key, column in self._columns.items():
+            column.extend(page.columns.get(key) or [_MISSING] * count)
+        for key, values in page.columns.items():
+            if key not in self._columns:
+                self._columns[key] = [_MISSING] * start + values
+
+        rows = list(range(start, start + count))
+        if self._live is not None:
+            self._live.extend(rows)
+        return rows
+
+    def _write_row(self, row, inst_data):
+        for key, value in inst_data.items():
+            _RowData(self, row)[key] = value
+
+    def _set_id(self, row, inst_id):
+        old_id = self._ids[row]
+        if old_id == inst_id:
+            return
+        if old_id is not None and self._rows.get(old_id) == row:
+            del self._rows[old_id]
+        self._ids[row] = inst_id
+        if inst_id is not None:
+            self._rows[inst_id] = row
+
+    def _set_geometry(self, row, geometry):
+        self._geometries.pop(row, None)
+        point = _point_of(geometry)
+        if point is not None:
+            self._xs[row], self._ys[row] = point
+        else:
+            self._xs[row] = self._ys[row] = NAN
+            self._geometries[row] = geometry
+
+    def _geometry(self, row):
+        x = self._xs[row]
+        if math.isnan(x):
+            return self._geometries.get(row)
+        return {'type': 'Point', 'coordinates': [x, self._ys[row]]}
+
+    def _set_property(self, row, key, value):
+        column = self._columns.get(key)
+        if column is None:
+            column = self._columns[intern(key) if isinstance(key, str) else key] = \
+                [_MISSING] * len(self._ids)
+        column[row] = _intern_value(value)
+
+    def _set_properties(self, row, properties):
+        for column in self._columns.values():
+            column[row] = _MISSING
+        for key, value in dict(properties).items():
+            self._set_property(row, key, value)
+
+    def _row_dict(self, row):
+        inst_data = {'type': 'Feature',
+                     'geometry': self._geometry(row),
+                     'properties': dict(
+                         (key, column[row]) for key, column in self._columns.items()
+                         if column[row] is not _MISSING)}
+        inst_id = self._ids[row]
+        if inst_id is not None and inst_id is not _DELETED:
+            inst_data['id'] = inst_id
+        inst_data.update(self._extras.get(row, {}))
+        return inst_data
+
+    def _view(self, row):
+        view = self._views.get(row)
+        if view is None:
+            view = self._make_inst({})
+            view._data = _RowData(self, row)
+            view._mark_clean()
+            self._views[row] = view
+        return view
+
+    def _file(self, inst):
+        # Rows are re-keyed as their id is set.
+        pass
+
+    def _owns(self, inst):
+        return self._row_of(inst) is not None
+
+    def _materialized(self):
+        # Views that carry state are pinned; the rest hold nothing of note.
+        return list(self._pinned.values())
+
+    def _row_of(self, inst):
+        data = inst._data
+        if isinstance(data, _RowData) and data.store is self:
+            return data.row
+        return None
+
+    # Collection interface
+    def add(self, inst_data):
+        inst_id = self._id_of(inst_data)
+        row = self._rows.get(inst_id) if inst_id is not None else None
+
+        if row is not None:
+            inst = self._view(row)
+            self._unindex(inst)
+            inst._load(inst_data)
+        else:
+            row = self._append_row(inst_data)
+            inst = None
+
+        if self._indexes:
+            inst = inst or self._view(row)
+            self._index(inst)
+        return inst or self._view(row)
+
+    def update(self, collection_data):
+        rows = []
+        for inst_data in collection_data:
+            inst_id = self._id_of(inst_data)
+            row = self._rows.get(inst_id) if inst_id is not None else None
+            if row is not None or self._indexes:
+                row = self._row_of(self.add(inst_data))
+            else:
+                row = self._append_row(inst_data)
+            rows.append(row)
+        return _RowViews(self, rows)
+
+    def _register(self, inst):
+        # Move the instance's data into a new row and make it that row's view.
+        row = self._append_row(inst._data)
+        inst.collection = self
+        inst._data = _RowData(self, row)
+        self._views[row] = inst
+        self._index(inst)
+        return inst
+
+    def bulk_save(self, insts, concurrency=8):
+        def merge(inst):
+            if self._row_of(inst) is None:
+                self._register(inst)
+
+        return run_bulk(lambda inst: inst.save(), insts, concurrency,
+                        on_success=merge, skip=is_unchanged)
+
+    def remove(self, inst):
+        row = self._row_of(inst)
+        if row is None:
+            row = self._rows.get(inst.key())
+            if row is None:
+                return
+            inst = self._view(row)
+
+        self._unindex(inst)
+        inst._data = inst._data.copy()
+        self._set_id(row, None)
+        self._ids[row] = _DELETED
+        self._set_geometry(row, None)
+        self._set_properties(row, {})
+        self._geometries.pop(row, None)
+        self._extras.pop(row, None)
+        self._views.pop(row, None)
+        self._pinned.pop(row, None)
+        self._live = None
+
+    def _remove_ids(self, inst_ids):
+        for inst_id in inst_ids:
+            self.remove(self._view(self._rows[inst_id]))
+        return len(inst_ids)
+
+    def _iter_serialized(self):
+        for row in self._live_rows():
+            yield self._row_dict(row)
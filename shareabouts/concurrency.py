@@ -0,0 +1,134 @@
+from __future__ import unicode_literals
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+def bounded_imap(func, items, max_workers, ordered=True, executor=None):
+    """
+    Lazily maps ``func`` over ``items`` on a thread pool, yielding
+    ``(item, future)`` pairs as they finish.
+
+    At most ``max_workers`` calls are in flight or waiting to be consumed at
+    any time, so a slow consumer holds back the producers instead of letting
+    results pile up. With ``ordered`` the pairs come back in the order of
+    ``items``; otherwise they come back in completion order.
+
+    If the generator is closed early, calls that have not started are
+    cancelled.
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    items = iter(items)
+    pending = deque()
+
+    def submit_next():
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            return True
+        return False
+
+    try:
+        while len(pending) < max_workers and submit_next():
+            pass
+
+        while pending:
+            if ordered:
+                item, future = pending.popleft()
+                future.exception()
+            else:
+                done, _ = wait([f for _, f in pending],
+                               return_when=FIRST_COMPLETED)
+                for index, (item, future) in enumerate(pending):
+                    if future in done:
+                        del pending[index]
+                        break
+
+            submit_next()
+            yield item, future
+
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+class _Flight (object):
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight (object):
+    """
+    Collapses concurrent calls for the same key into one. The first caller
+    runs the function; callers that arrive while it is running wait for it
+    and get the same result (or exception), not a copy of it.
+
+    ``stats()`` reports how many calls ran and how many were shared, the
+    most callers that have shared one call, and the callers waiting right
+    now; ``in_flight()`` breaks those down by key. Nothing is kept for a key
+    once its call finishes, so any number of distinct keys can be used.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.calls = 0
+        self.shared = 0
+        self.max_waiters = 0
+
+    def do(self, key, func, *args):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+                leader = True
+            else:
+                flight.waiters += 1
+                self.shared += 1
+                self.max_waiters = max(self.max_waiters, flight.waiters)
+                leader = False
+
+        if leader:
+            try:
+                flight.result = func(*args)
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.result
+
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def in_flight(self):
+        """
+        Returns the number of callers waiting on each key in flight.
+        """
+        with self._lock:
+            return dict((key, flight.waiters)
+                        for key, flight in self._flights.items())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'shared': self.shared,
+                'max_waiters': self.max_waiters,
+                'in_flight': len(self._flights),
+                'waiting': sum(flight.waiters for flight in self._flights.values()),
+            }
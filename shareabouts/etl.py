@@ -0,0 +1,115 @@
+"""
+Bulk loading for ETL: every page of a collection is downloaded on a pool of
+threads and decoded on a pool of processes, so that decoding, which is
+what limits a single core, scales with the number of cores.
+
+    places = CompactPlaceSet(api, dataset)
+    for page in bulk_load(places, processes=4, concurrency=8):
+        pass
+
+Pages of places are also normalized in the worker processes into
+PlaceColumns (see shareabouts.compact): properties become columns and
+point coordinates become arrays, which cross back from the workers far
+more cheaply than nested dicts. A CompactPlaceSet takes such a page as it
+is; other collections are given the records.
+"""
+from __future__ import unicode_literals
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+
+from shareabouts.compact import CompactPlaceSet, normalize_places
+from shareabouts.concurrency import bounded_imap
+from shareabouts.models import ShareaboutsPlaceSet
+
+
+def _download(api, url):
+    response = api.send('GET', url)
+    if response.status_code != 200:
+        raise api._invalid_response(url, response)
+    return response.content
+
+
+def decode_page(body, codec, metadata_attr, results_attr, normalize):
+    """
+    Decodes a page, in a worker process. Returns its metadata, the number
+    of results, and the results, as PlaceColumns if ``normalize``.
+    """
+    page_data = codec.loads(body)
+    results = page_data[results_attr]
+    if normalize:
+        return page_data[metadata_attr], len(results), normalize_places(results)
+    return page_data[metadata_attr], len(results), results
+
+
+def _completed(func, *args):
+    # Runs the function now, for when there is no process pool.
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def bulk_load(collection, processes=None, concurrency=4, merge=True,
+              normalize=None, url=None, **options):
+    """
+    Fetches every page of the collection, yielding the results of each page
+    in order: PlaceColumns for places (unless ``normalize`` is False), or
+    lists of records. With ``merge``, each page is added to the collection
+    first.
+
+    Pages are downloaded ``concurrency`` at a time, and decoded on a pool of
+    ``processes`` processes (by default, one per core) while the next ones
+    download. ``processes=0`` decodes on the calling thread instead. Any
+    other options are passed as query parameters.
+    """
+    api = collection.api()
+    if normalize is None:
+        normalize = isinstance(collection, ShareaboutsPlaceSet)
+    decode = partial(decode_page, codec=api.codec,
+                     metadata_attr=collection._metadata_attr,
+                     results_attr=collection._results_attr, normalize=normalize)
+
+    def merged(results):
+        if merge:
+            if isinstance(results, list):
+                collection.update(results)
+            elif isinstance(collection, CompactPlaceSet):
+                collection._append_columns(results)
+            else:
+                collection.update(list(results.features()))
+        return results
+
+    options.setdefault('page_size', 250)
+    workers = processes if processes is not None else multiprocessing.cpu_count()
+    pool = ProcessPoolExecutor(workers) if workers else None
+    submit = pool.submit if pool is not None else _completed
+    try:
+        first_url = collection._page_url(url or collection.url(), options)
+        metadata, count, results = submit(decode, _download(api, first_url)).result()
+        yield merged(results)
+
+        next_url = metadata.get('next')
+        if not next_url:
+            return
+
+        # Only the shape of the first page matters for the page count.
+        collection.parse_page_count({collection._metadata_attr: metadata,
+                                     collection._results_attr: range(count)})
+        page_urls = collection._numbered_page_urls(next_url, collection.page_count)
+
+        # Keep each process busy with a page or two while pages download.
+        decoding, max_decoding = deque(), 2 * (workers or 1)
+        for _, download in bounded_imap(partial(_download, api), page_urls, concurrency):
+            decoding.append(submit(decode, download.result()))
+            while len(decoding) >= max_decoding:
+                yield merged(decoding.popleft().result()[2])
+        while decoding:
+            yield merged(decoding.popleft().result()[2])
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False)
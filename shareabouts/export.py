@@ -0,0 +1,264 @@
+"""
+Streams a dataset out as GeoJSON or NDJSON, one record at a time, so that
+memory use doesn't grow with the size of the dataset:
+
+    with open('demo.geojson.gz', 'wb') as f:
+        report = export_dataset(dataset, f, compress=True,
+                                submission_sets=['comments'], concurrency=4)
+    print(report)
+
+By default the records come straight from the server, a page at a time,
+and nothing is kept in the dataset. With ``loaded=True``, the places and
+submissions already loaded into the dataset are written instead.
+
+The GeoJSON output is a FeatureCollection of the places, with the
+dataset's fields in a ``dataset`` member and the submissions in a
+``submission_sets`` member (an object of set name to a list of
+submissions). The NDJSON output has one place feature per line, followed
+by one line per submission with a ``set_name`` member added.
+"""
+from __future__ import unicode_literals, division
+
+import gzip
+
+from shareabouts.codec import get_codec
+from shareabouts.stats import timer
+
+try:
+    # Python 2
+    string_types = basestring
+except NameError:
+    # Python 3
+    string_types = str
+
+
+FORMATS = ('geojson', 'ndjson')
+
+# Output is collected into writes of about this many bytes.
+BUFFER_SIZE = 256 * 1024
+
+
+class ExportReport (object):
+    """
+    What an export wrote and how fast. ``bytes`` counts the JSON written,
+    and ``compressed_bytes`` what reached the file when compressing.
+    """
+    def __init__(self, format):
+        self.format = format
+        self.places = 0
+        self.submissions = 0
+        self.bytes = 0
+        self.compressed_bytes = None
+        self.seconds = 0.0
+
+    @property
+    def records(self):
+        return self.places + self.submissions
+
+    @property
+    def records_per_sec(self):
+        return self.records / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_sec(self):
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return {'format': self.format, 'places': self.places,
+                'submissions': self.submissions, 'bytes': self.bytes,
+                'compressed_bytes': self.compressed_bytes,
+                'seconds': self.seconds,
+                'records_per_sec': self.records_per_sec,
+                'bytes_per_sec': self.bytes_per_sec}
+
+    def __str__(self):
+        return ('<ExportReport {0} places, {1} submissions, {2} bytes '
+                'in {3:.2f}s ({4:.0f} records/s, {5:.1f} MB/s)>').format(
+            self.places, self.submissions, self.bytes, self.seconds,
+            self.records_per_sec, self.bytes_per_sec / 1e6)
+
+
+class _CountingFile (object):
+    # Counts the bytes written through it to the file.
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        flush = getattr(self.fileobj, 'flush', None)
+        if flush is not None:
+            flush()
+
+
+class DatasetWriter (object):
+    """
+    Writes places and then submissions as GeoJSON or NDJSON to a binary
+    file-like object, buffering the encoded records into large writes.
+    Call ``close`` to finish the document; the file itself is left open.
+    """
+    def __init__(self, fileobj, format='geojson', compress=False, codec=None,
+                 dataset_fields=None, compresslevel=6):
+        if format not in FORMATS:
+            raise ValueError('Unknown format {0!r}; expected one of {1}'.format(format, FORMATS))
+        self.format = format
+        self.codec = codec or get_codec()
+        self.report = ExportReport(format)
+
+        self._counter = None
+        if compress:
+            self._counter = _CountingFile(fileobj)
+            fileobj = gzip.GzipFile(fileobj=self._counter, mode='wb',
+                                    compresslevel=compresslevel)
+        self._file = fileobj
+        self._buffer = []
+        self._buffered = 0
+        self._set_name = None
+        self._first = True
+        self._start = timer()
+
+        if format == 'geojson':
+            self._write(b'{"type":"FeatureCollection",')
+            if dataset_fields:
+                self._write(b'"dataset":' + self.codec.dumps(dataset_fields) + b',')
+            self._write(b'"features":[\n')
+
+    def _write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._file.write(b''.join(self._buffer))
+            self.report.bytes += self._buffered
+            self._buffer, self._buffered = [], 0
+
+    def _write_item(self, encoded):
+        # Writes an item of the current JSON list, or a line of NDJSON.
+        if self.format == 'ndjson':
+            self._write(encoded + b'\n')
+        elif self._first:
+            self._write(encoded)
+            self._first = False
+        else:
+            self._write(b',\n' + encoded)
+
+    def write_place(self, place_data):
+        if self._set_name is not None:
+            raise ValueError('Places must be written before any submissions')
+        self._write_item(self.codec.dumps(place_data))
+        self.report.places += 1
+
+    def write_places(self, records):
+        for place_data in records:
+            self.write_place(place_data)
+
+    def write_submission(self, set_name, submission_data):
+        """
+        Writes a submission. In GeoJSON, the submissions of a set must all
+        be written together.
+        """
+        if set_name != self._set_name:
+            self._start_set(set_name)
+        if self.format == 'ndjson':
+            submission_data = dict(submission_data, set_name=set_name)
+        self._write_item(self.codec.dumps(submission_data))
+        self.report.submissions += 1
+
+    def write_submissions(self, set_name, records):
+        self._start_set(set_name)
+        for submission_data in records:
+            self.write_submission(set_name, submission_data)
+
+    def _start_set(self, set_name):
+        if set_name == self._set_name:
+            return
+        if self.format == 'geojson':
+            if self._set_name is None:
+                self._write(b'],"submission_sets":{')
+            else:
+                self._write(b'],')
+            self._write(self.codec.dumps(set_name) + b':[\n')
+            self._first = True
+        self._set_name = set_name
+
+    def close(self):
+        """
+        Finishes the document and returns the ExportReport.
+        """
+        if self.format == 'geojson':
+            self._write(b']}}\n' if self._set_name is not None else b']}\n')
+        self._flush()
+        if self._counter is not None:
+            self._file.close()
+            self.report.compressed_bytes = self._counter.count
+        self.report.seconds = timer() - self._start
+        return self.report
+
+
+def _loaded_submissions(dataset, set_name):
+    # A submission loaded both dataset-wide and through its place is
+    # written once.
+    written = set()
+    for place, sset in dataset._loaded_submission_sets():
+        if sset.name != set_name:
+            continue
+        place_url = place.url() if place is not None and place.has_key() else None
+        for submission_data in sset._iter_serialized():
+            submission_id = submission_data.get('id')
+            if submission_id is not None:
+                if submission_id in written:
+                    continue
+                written.add(submission_id)
+            if 'place' not in submission_data and place_url is not None:
+                submission_data = dict(submission_data, place=place_url)
+            yield submission_data
+
+
+def _loaded_set_names(dataset):
+    return sorted(set(sset.name for _, sset in dataset._loaded_submission_sets()))
+
+
+def export_dataset(dataset, fileobj, format='geojson', compress=False,
+                   submission_sets=None, loaded=False, concurrency=1,
+                   incremental=False, codec=None, **options):
+    """
+    Writes a dataset's places, and the submissions in ``submission_sets``,
+    to ``fileobj`` (a binary file-like object or a path) and returns an
+    ExportReport.
+
+    Unless ``loaded``, the records are streamed from the server; with
+    ``concurrency`` greater than 1, that many pages are fetched at once.
+    ``incremental`` decodes each page from the response as it arrives
+    instead. Any other options are passed as query parameters. With
+    ``loaded``, the loaded records are written, and ``submission_sets``
+    defaults to every loaded set.
+    """
+    if isinstance(fileobj, string_types):
+        with open(fileobj, 'wb') as f:
+            return export_dataset(dataset, f, format, compress, submission_sets,
+                                  loaded, concurrency, incremental, codec, **options)
+
+    writer = DatasetWriter(fileobj, format, compress,
+                           codec=codec or dataset.api().codec,
+                           dataset_fields=dataset._fields())
+
+    if loaded:
+        writer.write_places(dataset.places._iter_serialized())
+        if submission_sets is None:
+            submission_sets = _loaded_set_names(dataset)
+        for set_name in submission_sets:
+            writer.write_submissions(set_name, _loaded_submissions(dataset, set_name))
+    else:
+        stream_options = dict(options, incremental=incremental, concurrency=concurrency)
+        writer.write_places(dataset.places.stream(**stream_options))
+        for set_name in submission_sets or ():
+            writer.write_submissions(
+                set_name, dataset.submissions.in_set(set_name).stream(**stream_options))
+
+    return writer.close()
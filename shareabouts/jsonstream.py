@@ -0,0 +1,115 @@
+from __future__ import unicode_literals
+
+import codecs
+import json
+import re
+
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JSONResultsStream (object):
+    """
+    Incrementally decodes a JSON object from an iterable of byte chunks,
+    yielding the elements of its ``results_attr`` array one at a time
+    instead of building the whole document in memory.
+
+    Every other member of the object is decoded normally and collected in
+    ``document`` (so the page metadata is available once iteration is
+    finished, even if it came after the results).
+    """
+    def __init__(self, chunks, results_attr, encoding='utf-8'):
+        self.results_attr = results_attr
+        self.document = {}
+
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder(encoding)()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, min_chars=1):
+        # Reads at least min_chars more characters into the buffer, dropping
+        # what has already been consumed. Returns False at the end of input.
+        if self._eof:
+            return False
+
+        pieces = [self._buffer[self._pos:]]
+        added = 0
+        for chunk in self._chunks:
+            text = self._text.decode(chunk)
+            pieces.append(text)
+            added += len(text)
+            if added >= min_chars:
+                break
+        else:
+            pieces.append(self._text.decode(b'', True))
+            self._eof = True
+
+        self._buffer = ''.join(pieces)
+        self._pos = 0
+        return added > 0 or len(pieces[-1]) > 0
+
+    def _peek(self):
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of JSON input')
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError('Expected one of {0!r} at position {1}, got {2!r}'.format(
+                chars, self._pos, char))
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            pending = len(self._buffer) - self._pos
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                # Incomplete; read at least as much again and retry, so a
+                # large value is re-scanned only a logarithmic number of times.
+                if not self._fill(max(pending, 1)):
+                    raise
+                continue
+
+            # A number at the very end of the buffer may continue in the
+            # next chunk.
+            if end == len(self._buffer) and not self._eof:
+                if self._fill():
+                    continue
+
+            self._pos = end
+            return value
+
+    def __iter__(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+
+        while True:
+            key = self._value()
+            self._expect(':')
+
+            if key == self.results_attr:
+                self._expect('[')
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._expect(',]') == ']':
+                            break
+            else:
+                self.document[key] = self._value()
+
+            if self._expect(',}') == '}':
+                break
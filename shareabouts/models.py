@@ -4,25 +4,65 @@ import json
 import math
 import requests
 import datetime
+import threading
+from collections import OrderedDict
+from functools import partial
+from shareabouts.bulk import is_unchanged, run_bulk
+from shareabouts.cluster import GridClusterer
+from shareabouts.concurrency import bounded_imap
 from shareabouts.exceptions import ShareaboutsApiException
+from shareabouts.export import export_dataset
+from shareabouts.paging import Checkpoint
+from shareabouts.query import (LOOKUPS, HashIndex, SortedIndex, field_getter,
+                               in_range, index_values, parse_criteria, parse_datetime,
+                               range_bounds, sort_key)
+from shareabouts.spatial import GridIndex
+from shareabouts.stats import timer
+
+try:
+    # Python 2
+    string_types = basestring
+except NameError:
+    # Python 3
+    string_types = str
 
 try:
     # Python 2
     from urllib import urlencode
+    from urlparse import urlsplit, urlunsplit, parse_qsl
 except ImportError:
     # Python 3
-    from urllib.parse import urlencode
+    from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+
+try:
+    from collections.abc import Sequence
+except ImportError:
+    # Python 2
+    from collections import Sequence
 
 
 class ShareaboutsModel (object):
     _pk_attr = 'id'
     _excluded_fields = ['id', 'url', 'created_datetime', 'updated_datetime']
 
+    # The id the model is filed under in its collection's _data_by_id, and
+    # the collection that filed it.
+    _filed_key = None
+    _filed_in = None
+
+    # (collection url, key, url) from the last time the url was built.
+    _url_cache = None
+
     def __init__(self, api_proxy, collection=None, *args, **kwargs):
         self._api = api_proxy
         self._data = dict(*args, **kwargs)
         self.collection = collection
 
+        # Keys edited since the model was last loaded from (or saved to) the
+        # server. A model that has never been synced is always saved whole.
+        self._changed = set()
+        self._synced = False
+
     def __str__(self):
         return "<%s %s %s>" % (self.__class__.__name__, self.get(self._pk_attr), self._data)
 
@@ -38,12 +78,21 @@ class ShareaboutsModel (object):
     def url(self):
         if 'url' in self:
             return self['url']
-        elif self.collection and self._pk_attr in self:
-            collection_url = self.collection.url()
+        elif self.collection is not None and self._pk_attr in self:
+            # Built urls are reused for as long as the key and the
+            # collection's url (itself cached, so compared by identity) stay
+            # the same.
+            collection_url, key = self.collection.url(), self.key()
+            cached = self._url_cache
+            if cached is not None and cached[0] is collection_url and cached[1] == key:
+                return cached[2]
+
             if collection_url.endswith('/'):
-                return ''.join([collection_url, self.key()])
+                url = ''.join([collection_url, str(key)])
             else:
-                return '/'.join([collection_url, self.key()])
+                url = '/'.join([collection_url, str(key)])
+            self._url_cache = (collection_url, key, url)
+            return url
         else:
             raise ShareaboutsApiException(
                 'Model {0} has no url attribute.'.format(self))
@@ -51,15 +100,58 @@ class ShareaboutsModel (object):
     def parse(self, raw_data):
         return raw_data
 
-    def fetch(self, **options):
-        api, url = self.api(), self.url()
+    def _fetch_url(self, options):
         querystring = urlencode(options)
-        raw_data = api._get_parsed_data('?'.join([url, querystring]))
+        return '?'.join([self.url(), querystring])
+
+    def _load(self, inst_data, replace=False):
+        """
+        Applies data that came from the server, and marks the model as clean.
+        """
+        if replace:
+            self._data.clear()
+        self._data.update(inst_data)
+        self._mark_clean()
+
+    def _load_instance(self, raw_data):
+        api = self.api()
+        hooks = api._hooks
+        start = timer() if hooks else None
+
         inst_data = self.parse(raw_data)
-        self.clear()
-        self.update(inst_data)
+        self._load(inst_data, replace=True)
+
+        if start is not None:
+            api._emit(hooks, 'after_hydrate', {'model': type(self).__name__, 'count': 1,
+                                               'seconds': timer() - start})
         return self
 
+    def _mark_clean(self):
+        self._changed = set()
+        self._synced = True
+
+    def mark_changed(self, *keys):
+        """
+        Flags keys as changed. Needed when a nested value (a geometry's
+        coordinates, say) is modified in place rather than reassigned.
+        """
+        self._changed.update(keys)
+
+    def changed_fields(self):
+        """
+        Returns the set of keys changed since the model was last synced with
+        the server, or None if it never has been.
+        """
+        return set(self._changed) if self._synced else None
+
+    def is_dirty(self):
+        return not self._synced or bool(self._changed)
+
+    def fetch(self, **options):
+        api, url = self.api(), self._fetch_url(options)
+        raw_data = api._get_parsed_data(url)
+        return self._load_instance(raw_data)
+
     def is_new(self):
         return self._pk_attr not in self
     
@@ -69,8 +161,32 @@ class ShareaboutsModel (object):
     def serialize(self):
         return self._data
 
-    def save(self):
-        api = self.api()
+    def _partial_data(self):
+        """
+        Returns just the changed fields, or None if they can't be expressed
+        as a partial update (e.g. a field was deleted).
+        """
+        send_data = {}
+        for key in self._changed:
+            if key not in self._data:
+                return None
+            if key not in self._excluded_fields:
+                send_data[key] = self._data[key]
+        return send_data
+
+    def _save_request(self):
+        """
+        Returns the method, url, data and valid status codes of the request
+        that would save this model, or None if there is nothing to save.
+        """
+        if self.has_key():
+            if not self.is_dirty():
+                return None
+
+            if self._synced and self.api().partial_updates:
+                send_data = self._partial_data()
+                if send_data is not None:
+                    return 'PATCH', self.url(), send_data, [200]
 
         send_data = self.serialize().copy()
 
@@ -79,15 +195,40 @@ class ShareaboutsModel (object):
                 del send_data[field]
 
         if self.has_key():
-            response_data = api.send_and_parse('PUT', self.url(), send_data, [200])
+            return 'PUT', self.url(), send_data, [200]
         else:
-            response_data = api.send_and_parse('POST', self.collection.url(), send_data, [201])
+            return 'POST', self.collection.url(), send_data, [201]
+
+    def save(self):
+        """
+        Saves the model to the server. If the API has a write-behind queue,
+        the save is queued instead, and a Future of the model is returned.
+        """
+        api = self.api()
+        if api.write_behind is not None:
+            return api.write_behind.save(self)
 
-        self.update(response_data)
+        request = self._save_request()
+        if request is None:
+            return
+
+        method, url, send_data, valid = request
+        response_data = api.send_and_parse(method, url, send_data, valid)
+        self._load(response_data)
+        if self.collection is not None:
+            self.collection._reindex(self)
 
     def destroy(self):
+        write_behind = self.api().write_behind
+        if write_behind is not None:
+            # The model leaves its collection now, but keeps a reference to
+            # it to build the url to delete.
+            if self.collection is not None:
+                self.collection.remove(self)
+            return write_behind.destroy(self)
+
         if not self.is_new():
-            response = api.send('DELETE', self.url())
+            response = self.api().send('DELETE', self.url())
             
         if self.collection is not None:
             self.collection.remove(self)
@@ -95,13 +236,26 @@ class ShareaboutsModel (object):
 
     # Dictionary interface
     def __getitem__(self, key): return self._data[key]
-    def __setitem__(self, key, value): self._data[key] = value
-    def __delitem__(self, key): del self._data[key]
+    def __contains__(self, key): return key in self._data
     def __iter__(self): return iter(self._data)
-
     def get(self, key, default=None): return self._data.get(key, default)
-    def clear(self): return self._data.clear()
-    def update(self, other_data): return self._data.update(other_data)
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._changed.add(key)
+
+    def __delitem__(self, key):
+        del self._data[key]
+        self._changed.add(key)
+
+    def clear(self):
+        self._changed.update(self._data)
+        return self._data.clear()
+
+    def update(self, other_data):
+        other_data = dict(other_data)
+        self._changed.update(other_data)
+        return self._data.update(other_data)
 
 
 class ShareaboutsCollection (object):
@@ -109,11 +263,20 @@ class ShareaboutsCollection (object):
     _metadata_attr = 'metadata'
     _results_attr = 'results'
 
+    # Query parameters used by sync() to ask for records changed since the
+    # last sync, and for a cheap listing of the ids that still exist.
+    _sync_since_param = 'updated_datetime__gte'
+    _sync_ids_options = {'fields': 'id'}
+
     def __init__(self, api_proxy, model_class=None, *args, **kwargs):
         self._api = api_proxy
         self._model_class = model_class or self._model_class
         self._data = []
         self._data_by_id = {}
+        self._sync_mark = None
+        self._indexes = []
+        self._field_indexes = {}
+        self._index_lock = threading.Lock()
 
         self.update(list(*args, **kwargs))
 
@@ -133,6 +296,15 @@ class ShareaboutsCollection (object):
             raise ShareaboutsApiException(
                 'Collection {0} has no _url attribute.'.format(self))
 
+    def _child_url(self, parent_url, suffix):
+        # Builds parent_url + suffix once for each (cached) parent url.
+        cached = self.__dict__.get('_url_cache')
+        if cached is not None and cached[0] is parent_url:
+            return cached[1]
+        url = parent_url + suffix
+        self._url_cache = (parent_url, url)
+        return url
+
     def _make_inst(self, inst_data):
         Model = self._model_class
         inst = Model(self.api(), collection=self, **inst_data)
@@ -142,6 +314,39 @@ class ShareaboutsCollection (object):
         pk_attr = self._model_class._pk_attr
         return data.get(pk_attr, None)
 
+    def _field_of(self, inst_data, key):
+        # Reads a field from a raw record, as the model would.
+        return inst_data.get(key)
+
+    # Records loaded through update() are kept as the raw dicts from the
+    # server, and a model is made for one only when it's first accessed.
+    # _data and _data_by_id hold either models or raw records; the entry in
+    # _data_by_id is the current one.
+    def _resolve(self, entry):
+        if isinstance(entry, ShareaboutsModel):
+            return entry
+
+        inst_id = self._id_of(entry)
+        current = self._data_by_id.get(inst_id)
+        if isinstance(current, ShareaboutsModel):
+            return current
+
+        inst = self._make_inst(current if current is not None else entry)
+        inst._mark_clean()
+        if current is not None:
+            self._file(inst)
+        return inst
+
+    def _materialized(self):
+        """
+        Returns the models that have been made so far.
+        """
+        models = [entry for entry in self._data_by_id.values()
+                  if isinstance(entry, ShareaboutsModel)]
+        models.extend(entry for entry in self._data
+                      if isinstance(entry, ShareaboutsModel) and entry.key() is None)
+        return models
+
     def parse_page_count(self, raw_data):
         assert self._metadata_attr in raw_data
         assert self._results_attr in raw_data
@@ -167,56 +372,348 @@ class ShareaboutsCollection (object):
         self.parse_page_count(raw_data)
         return raw_data[self._results_attr]
 
-    def fetch(self, url=None, **options):
-        api, url = self.api(), url or self.url()
+    def _page_url(self, url, options):
         querystring = urlencode(options)
         if '?' not in url:
-            full_url = '?'.join([url, querystring])
+            return '?'.join([url, querystring])
         else:
-            full_url = '&'.join([url, querystring])
+            return '&'.join([url, querystring])
+
+    def _numbered_page_urls(self, next_url, page_count):
+        """
+        Builds the urls of every page from ``next_url`` through the last one,
+        by rewriting the ``page`` parameter of ``next_url``.
+        """
+        scheme, netloc, path, query, fragment = urlsplit(next_url)
+        params = parse_qsl(query, keep_blank_values=True)
+        first_page = int(dict(params).get('page', 2))
+        params = [(k, v) for k, v in params if k != 'page']
+
+        for page in range(first_page, page_count + 1):
+            query = urlencode(params + [('page', page)])
+            yield urlunsplit((scheme, netloc, path, query, fragment))
+
+    def _load_page(self, raw_data):
+        api = self.api()
+        hooks = api._hooks
+        start = timer() if hooks else None
 
-        raw_data = api._get_parsed_data(full_url)
         collection_data = self.parse(raw_data)
         self.update(collection_data)
+        self._advance_sync_mark(collection_data)
+
+        if start is not None:
+            api._emit(hooks, 'after_hydrate', {'model': self._model_class.__name__,
+                                               'count': len(collection_data),
+                                               'seconds': timer() - start})
         return raw_data
 
-    def fetch_all(self, url=None, **options):
-        page_url = url or self.url()
+    def fetch(self, url=None, **options):
+        api, url = self.api(), url or self.url()
+        full_url = self._page_url(url, options)
+        raw_data = api._get_parsed_data(full_url)
+        return self._load_page(raw_data)
+
+    def fetch_all(self, url=None, concurrency=1, ordered=True, pager=None,
+                  checkpoint=None, resume=None, track_ids=False, **options):
+        """
+        Fetches every page of the collection, yielding the raw data for each
+        page once it has been loaded into the collection.
+
+        With ``concurrency`` greater than 1, the first page is fetched alone
+        to learn the page count, and the rest are fetched on a pool of that
+        many threads. At most ``concurrency`` pages are in flight or waiting
+        to be consumed at once. Pages are yielded in page order unless
+        ``ordered`` is False, in which case they are yielded as they arrive.
+
+        With a ``pager`` (a shareabouts.paging.AdaptivePager), pages are
+        fetched one at a time instead, each sized from how long the ones
+        before it took.
+
+        ``checkpoint`` is called with a Checkpoint each time the consumer is
+        done with a page. Pass the last one (or its ``to_dict()``) as
+        ``resume`` to carry on from where it was taken. With ``track_ids``,
+        checkpoints also list the ids of the records fetched.
+        """
+        if checkpoint is not None and concurrency > 1 and not ordered:
+            raise ValueError('Checkpoints need the pages in order')
+
+        options.setdefault('page_size', 250)
+        if resume is None:
+            params = dict((key, value) for key, value in options.items()
+                          if key != 'page_size')
+            state = Checkpoint(url or self.url(), params, ids=[] if track_ids else None)
+            page_url = state.url
+        else:
+            state = resume if isinstance(resume, Checkpoint) else Checkpoint.from_dict(resume)
+            if state.done:
+                return
+            # The next page's url numbers it by this size.
+            options['page_size'] = state.page_size or options['page_size']
+            page_url = state.next if state.pages else state.url
+
+        if pager is not None:
+            pages = self._adaptive_pages(state, pager, options['page_size'])
+        elif concurrency > 1:
+            pages = self._concurrent_pages(page_url, concurrency, ordered, options)
+        else:
+            pages = self._sequential_pages(page_url, options)
+
+        for page_data, next_url, page_size in pages:
+            yield page_data
 
+            results = page_data[self._results_attr]
+            ids = [self._id_of(inst_data) for inst_data in results] if track_ids else results
+            state.advance(ids, next_url, page_size)
+            if checkpoint is not None:
+                checkpoint(state)
+
+    # Each of these yields every page's data, with the url and the size of
+    # the page after it.
+    def _sequential_pages(self, page_url, options):
         while page_url:
-            options.setdefault('page_size', 250)
             page_data = self.fetch(url=page_url, **options)
+            next_url = page_data[self._metadata_attr].get('next')
+            yield page_data, next_url, options['page_size']
+            page_url = next_url
+
+    def _concurrent_pages(self, page_url, concurrency, ordered, options):
+        page_size = options['page_size']
+        page_data = self.fetch(url=page_url, **options)
+        next_url = page_data[self._metadata_attr].get('next')
+        if not next_url:
+            yield page_data, None, page_size
+            return
+
+        page_urls = list(self._numbered_page_urls(next_url, self.page_count))
+        yield page_data, page_urls[0], page_size
+
+        api = self.api()
+        results = bounded_imap(api._get_parsed_data, page_urls,
+                               concurrency, ordered=ordered)
+        for position, (_, future) in enumerate(results, 1):
+            following = page_urls[position] if position < len(page_urls) else None
+            yield self._load_page(future.result()), following, page_size
+
+    def _adaptive_pages(self, state, pager, page_size):
+        api, offset = self.api(), state.offset
+        if not state.pages:
+            page_size = pager.first_size(page_size)
+
+        def page_url(size):
+            params = dict(state.params, page=offset // size + 1, page_size=size)
+            return self._page_url(state.url, params)
+
+        while True:
+            full_url = page_url(page_size)
+            start = timer()
+            status_code, page_data, response = api._shared_get(full_url)
+            if status_code != 200:
+                raise api._invalid_response(full_url, response)
+            self._load_page(page_data)
+
+            count = len(page_data[self._results_attr])
+            pager.observe(count, timer() - start,
+                          len(response.content) if response is not None else None)
+            offset += count
+
+            if not page_data[self._metadata_attr].get('next'):
+                yield page_data, None, page_size
+                return
+            page_size = pager.next_size(page_size, offset)
+            yield page_data, page_url(page_size), page_size
+
+    def _iter_raw_pages(self, url=None, concurrency=1, **options):
+        """
+        Yields the raw data of every page without loading it into the
+        collection. With ``concurrency`` greater than 1, the pages after the
+        first are fetched on a pool of threads, as in fetch_all, and yielded
+        in order.
+        """
+        api, page_url = self.api(), url or self.url()
+        options.setdefault('page_size', 250)
+
+        if concurrency > 1:
+            page_data = api._get_parsed_data(self._page_url(page_url, options))
+            yield page_data
+
+            next_url = page_data[self._metadata_attr].get('next')
+            if not next_url:
+                return
+
+            self.parse_page_count(page_data)
+            page_urls = self._numbered_page_urls(next_url, self.page_count)
+            for _, future in bounded_imap(api._get_parsed_data, page_urls, concurrency):
+                yield future.result()
+            return
+
+        while page_url:
+            page_data = api._get_parsed_data(self._page_url(page_url, options))
             yield page_data
             page_url = page_data[self._metadata_attr].get('next')
 
+    def stream(self, url=None, models=False, incremental=False, concurrency=1, **options):
+        """
+        Iterates over every record of every page without keeping anything in
+        the collection, so memory use stays constant however large the
+        collection is. Yields raw record dicts, or detached model instances
+        if ``models`` is True.
+
+        With ``incremental``, each page is decoded from the response stream
+        one record at a time, rather than being read and parsed whole. With
+        ``concurrency`` greater than 1 (and not ``incremental``), that many
+        pages are fetched at once.
+        """
+        if incremental:
+            records = self._iter_streamed_records(url, **options)
+        else:
+            records = (inst_data
+                       for page_data in self._iter_raw_pages(url, concurrency, **options)
+                       for inst_data in self.parse(page_data))
+
+        for inst_data in records:
+            if models:
+                inst = self._make_inst(inst_data)
+                inst._mark_clean()
+                yield inst
+            else:
+                yield inst_data
+
+    def _iter_streamed_records(self, url=None, **options):
+        api, page_url = self.api(), url or self.url()
+        options.setdefault('page_size', 250)
+
+        while page_url:
+            records = api._stream_results(self._page_url(page_url, options),
+                                          self._results_attr)
+            for inst_data in records:
+                yield inst_data
+            page_url = records.document[self._metadata_attr].get('next')
+
+    def _advance_sync_mark(self, collection_data):
+        # Datetimes are compared parsed, since strings with different
+        # offsets or fractions of a second don't sort in time order.
+        mark = self._sync_mark
+        mark_time = parse_datetime(mark) if isinstance(mark, string_types) else None
+        for inst_data in collection_data:
+            updated = self._field_of(inst_data, 'updated_datetime')
+            if not isinstance(updated, string_types):
+                continue
+            updated_time = parse_datetime(updated)
+            if updated_time is not None and (mark_time is None or updated_time > mark_time):
+                mark, mark_time = updated, updated_time
+        self._sync_mark = mark
+
+    def sync(self, detect_deletions=True, **options):
+        """
+        Brings the collection up to date with the server, fetching only the
+        records updated since the latest one loaded by fetch, fetch_all or
+        an earlier sync (a collection with nothing loaded fetches
+        everything). Returns a dict with the number of records ``updated``
+        and ``removed``. Records on pages that were never loaded are only
+        fetched once they are updated.
+
+        Deletions are found by comparing the server's record count with the
+        local one, and, only if they differ, listing the ids that still
+        exist on the server.
+        """
+        since = self._sync_mark
+        if since is not None:
+            options[self._sync_since_param] = since
+
+        updated = 0
+        for page_data in self._iter_raw_pages(**options):
+            collection_data = self.parse(page_data)
+            self.update(collection_data)
+            self._advance_sync_mark(collection_data)
+            updated += len(collection_data)
+
+        removed = 0
+        if detect_deletions and since is not None:
+            probe = next(self._iter_raw_pages(page_size=1))
+            remote_length = probe[self._metadata_attr].get('length')
+            if remote_length != len(self._data_by_id):
+                remote_ids = set()
+                for page_data in self._iter_raw_pages(**self._sync_ids_options):
+                    for inst_data in page_data[self._results_attr]:
+                        remote_ids.add(self._id_of(inst_data))
+                removed = self._remove_ids(set(self._data_by_id) - remote_ids)
+
+        return {'updated': updated, 'removed': removed}
+
     def create(self, inst_data):
         inst = self._make_inst(inst_data)
         inst.save()
-        self.add(inst)
+        self._register(inst)
         return inst
 
+    def bulk_create(self, records, concurrency=8):
+        """
+        Creates a model for each record and saves them all over a pool of
+        ``concurrency`` threads. Returns a BulkReport; successfully created
+        instances are added to the collection.
+        """
+        insts = [self._make_inst(inst_data) for inst_data in records]
+        return run_bulk(lambda inst: inst.save(), insts, concurrency,
+                        on_success=self._register)
+
+    def bulk_save(self, insts, concurrency=8):
+        """
+        Saves many instances over a pool of ``concurrency`` threads,
+        returning a BulkReport. Ids and urls assigned by the server are
+        indexed in the collection as each save finishes.
+        """
+        present = set(id(inst) for inst in self._materialized())
+
+        def merge(inst):
+            if id(inst) in present:
+                self._file(inst)
+            else:
+                self._register(inst)
+
+        return run_bulk(lambda inst: inst.save(), insts, concurrency,
+                        on_success=merge, skip=is_unchanged)
+
     def serialize(self):
-        return [inst.serialize() for inst in self]
+        return list(self._iter_serialized())
+
+    def _iter_serialized(self):
+        # A raw record is already in its serialized form.
+        by_id = self._data_by_id
+        for entry in self._data:
+            if not isinstance(entry, ShareaboutsModel):
+                entry = by_id.get(self._id_of(entry), entry)
+            yield entry.serialize() if isinstance(entry, ShareaboutsModel) else entry
 
     # Dictionary-like interface
     def get(self, key, default=None):
         try:
-            return self._data_by_id[key]
+            entry = self._data_by_id[key]
         except KeyError:
             if isinstance(default, dict):
                 return self._make_inst(default)
             else:
                 return default
+        return self._resolve(entry)
 
     # List-like interface
     def __getitem__(self, index):
-        return self._data[index]
+        if isinstance(index, slice):
+            return [self._resolve(entry) for entry in self._data[index]]
+        return self._resolve(self._data[index])
 
     def __setitem__(self, index, value):
         self._data[index] = value
 
     def __iter__(self):
-        return iter(self._data)
+        data = self._data
+        for index, entry in enumerate(data):
+            if not isinstance(entry, ShareaboutsModel):
+                entry = data[index] = self._resolve(entry)
+                if entry._filed_in is not self:
+                    # A record without an id, now kept as its model.
+                    self._file(entry)
+            yield entry
 
     # Set-like interface
     def __contains__(self, inst_data):
@@ -227,22 +724,351 @@ class ShareaboutsCollection (object):
         inst_id = self._id_of(inst_data)
         inst = self.get(inst_id)
         if inst:
-            inst.update(inst_data)
+            self._unindex(inst)
+            inst._load(inst_data)
         else:
             inst = self._make_inst(inst_data)
+            inst._mark_clean()
             self._data.append(inst)
-            if inst_id is not None:
-                self._data_by_id[inst_id] = inst
-                # NOTE: When the instance's id changes, we need to notice.
+            self._file(inst)
+        self._index(inst)
         return inst
 
+    def _register(self, inst):
+        inst.collection = self
+        self._data.append(inst)
+        self._file(inst)
+        self._index(inst)
+        return inst
+
+    def _file(self, inst):
+        """
+        Files the instance in _data_by_id under its current id, moving it
+        from the id it was filed under if that has changed (when a new
+        instance is given an id by saving it, say).
+        """
+        inst_id, old_id = inst.key(), inst._filed_key
+        by_id = self._data_by_id
+        if old_id is not None and old_id != inst_id and by_id.get(old_id) is inst:
+            del by_id[old_id]
+        if inst_id is not None:
+            by_id[inst_id] = inst
+        inst._filed_key = inst_id
+        inst._filed_in = self
+
+    def _owns(self, inst):
+        # Whether the instance is one of the collection's, rather than one
+        # made by stream(), get() or _make_inst() that was never added.
+        return inst._filed_in is self
+
+    # Secondary indexes. An index is any object with add(inst) and
+    # discard(inst) methods; the collection keeps it current as instances
+    # are added, updated, saved and removed.
+    def add_index(self, index):
+        with self._index_lock:
+            for inst in self:
+                index.add(inst)
+            self._indexes.append(index)
+        return index
+
+    def remove_index(self, index):
+        with self._index_lock:
+            self._indexes.remove(index)
+
+    def _index(self, inst):
+        if self._indexes:
+            with self._index_lock:
+                for index in self._indexes:
+                    index.add(inst)
+
+    def _unindex(self, inst):
+        if self._indexes:
+            with self._index_lock:
+                for index in self._indexes:
+                    index.discard(inst)
+
+    def _reindex(self, inst):
+        if not self._owns(inst):
+            return
+        self._file(inst)
+        self._unindex(inst)
+        self._index(inst)
+
+    # Local queries; see shareabouts.query.
+    def index_on(self, path, ordered=False):
+        """
+        Returns the collection's index on the field at a path, building it
+        on first use. An ``ordered`` index also answers range queries.
+        Loading records into a collection with indexes makes their models
+        right away, to index them.
+        """
+        index = self._field_indexes.get(path)
+        if index is None or (ordered and not index.ordered):
+            if index is not None:
+                self.remove_index(index)
+            index = SortedIndex(path) if ordered else HashIndex(path)
+            self._field_indexes[path] = self.add_index(index)
+        return index
+
+    def drop_index(self, path):
+        index = self._field_indexes.pop(path, None)
+        if index is not None:
+            self.remove_index(index)
+
+    def _entries(self):
+        # The current model or raw record for each instance.
+        by_id = self._data_by_id
+        if len(by_id) == len(self._data):
+            # Every instance has an id.
+            return by_id.values()
+        return list(by_id.values()) + [entry for entry in self._data
+                                       if isinstance(entry, ShareaboutsModel)
+                                       and entry.key() is None]
+
+    def _entry_getter(self, path):
+        # Reads a field from a model or a raw record, without making a model.
+        get_from_model = field_getter(path)
+        first, rest = path.split('.')[0], path.split('.')[1:]
+
+        def get(entry):
+            if isinstance(entry, ShareaboutsModel):
+                return get_from_model(entry)
+            value = self._field_of(entry, first)
+            for key in rest:
+                if not isinstance(value, dict):
+                    return None
+                value = value.get(key)
+            return value
+        return get
+
+    def _candidates(self, conditions):
+        """
+        Returns the models that an index says may match the conditions (the
+        fewest it can find), or None if no condition has an index.
+        """
+        best = None
+        for path, lookup, arg in conditions:
+            index = self._field_indexes.get(path)
+            if index is None:
+                continue
+
+            try:
+                if lookup == 'exact':
+                    size = index.count(arg)
+                    found = partial(index.lookup, arg)
+                elif lookup == 'in':
+                    args = set(arg)
+                    size = sum(index.count(item) for item in args)
+                    found = partial(_lookup_all, index, args)
+                elif lookup in ('gt', 'gte') and index.ordered:
+                    found = index.range(arg, None)
+                    size = len(found)
+                elif lookup in ('lt', 'lte') and index.ordered:
+                    found = index.range(None, arg, include_end=(lookup == 'lte'))
+                    size = len(found)
+                else:
+                    continue
+            except (TypeError, ValueError):
+                # An unhashable or unorderable argument; check it by scanning.
+                continue
+
+            if best is None or size < best[0]:
+                best = (size, found)
+
+        if best is None:
+            return None
+        found = best[1]
+        return found() if callable(found) else found
+
+    def _query(self, criteria):
+        conditions = parse_criteria(criteria)
+        candidates = self._candidates(conditions)
+        if candidates is None:
+            candidates = self._entries()
+        elif len(candidates) > 1:
+            # An 'in' lookup finds a model once for each item it has.
+            candidates = list(OrderedDict((id(inst), inst) for inst in candidates).values())
+
+        checks = [(self._entry_getter(path), LOOKUPS[lookup], arg)
+                  for path, lookup, arg in conditions]
+        if len(checks) == 1:
+            [(get, test, arg)] = checks
+            return [entry for entry in candidates if _matches(get(entry), test, arg)]
+        return [entry for entry in candidates
+                if all(_matches(get(entry), test, arg) for get, test, arg in checks)]
+
+    def filter(self, *criteria, **kwargs):
+        """
+        Returns the models that match every criterion. Criteria are given as
+        keyword arguments (or dicts, for dotted paths) of the form
+        ``field__lookup=value``, where the lookup is one of exact (the
+        default), in, gt, gte, lt, lte and isnull. A field that holds a
+        list matches exact and in if any of its items does.
+        """
+        return [self._resolve(entry) for entry in
+                self._query(_merge_criteria(criteria, kwargs))]
+
+    def count(self, *criteria, **kwargs):
+        """
+        Returns the number of models that match the criteria, as for
+        ``filter``, without making models for them.
+        """
+        criteria = _merge_criteria(criteria, kwargs)
+        if len(criteria) == 1:
+            [(path, lookup, arg)] = parse_criteria(criteria)
+            index = self._field_indexes.get(path)
+            if index is not None and lookup == 'exact':
+                try:
+                    return index.count(arg)
+                except TypeError:
+                    pass
+        return len(self._query(criteria))
+
+    def _group_entries(self, path):
+        groups = {}
+        get = self._entry_getter(path)
+        for entry in self._entries():
+            for value in index_values(get(entry)):
+                groups.setdefault(value, []).append(entry)
+        return groups
+
+    def group_by(self, path):
+        """
+        Returns a dict of each value of the field to the models that have
+        it. A model whose field holds a list is in the group of each item.
+        """
+        index = self._field_indexes.get(path)
+        if index is not None:
+            return index.groups()
+        return dict((value, [self._resolve(entry) for entry in entries])
+                    for value, entries in self._group_entries(path).items())
+
+    def count_by(self, path):
+        """
+        Returns a dict of each value of the field to the number of models
+        that have it.
+        """
+        index = self._field_indexes.get(path)
+        if index is not None:
+            return index.counts()
+        return dict((value, len(entries))
+                    for value, entries in self._group_entries(path).items())
+
+    def range(self, path, start=None, end=None):
+        """
+        Returns the models whose field is at least ``start`` and less than
+        ``end``, in order of the field. Dates, datetimes and ISO 8601
+        strings all compare as datetimes (naive ones are taken as UTC).
+        """
+        index = self._field_indexes.get(path)
+        if index is not None and index.ordered:
+            return index.range(start, end)
+
+        low, high = range_bounds(start, end)
+        get, keyed = self._entry_getter(path), []
+        for position, entry in enumerate(self._entries()):
+            key = sort_key(get(entry))
+            if in_range(key, low, high):
+                keyed.append((key, position, entry))
+        keyed.sort(key=lambda item: item[:2])
+        return [self._resolve(entry) for _, _, entry in keyed]
+
     def update(self, collection_data):
+        """
+        Adds or updates a record for each item. New records are stored as
+        they are, and a model is made for each one only when it is first
+        accessed, unless the collection has indexes to keep up to date.
+        Returns the models as a sequence that makes them on access.
+        """
+        if self._indexes:
+            return [self.add(inst_data) for inst_data in collection_data]
+
+        by_id, entries = self._data_by_id, []
         for inst_data in collection_data:
-            self.add(inst_data)
-    
+            inst_id = self._id_of(inst_data)
+            current = by_id.get(inst_id) if inst_id is not None else None
+
+            if inst_id is None or isinstance(current, ShareaboutsModel):
+                entries.append(self.add(inst_data))
+            else:
+                if current is None:
+                    self._data.append(inst_data)
+                else:
+                    # Merge into the record, as add() does into a model.
+                    merged = dict(current)
+                    merged.update(inst_data)
+                    inst_data = merged
+                by_id[inst_id] = inst_data
+                entries.append(inst_data)
+        return _LazyModels(self, entries)
+
     def remove(self, inst):
-        # TODO: implement removal.
-        pass
+        self._unindex(inst)
+        inst_id = inst.key()
+        for filed_id in (inst_id, inst._filed_key):
+            if filed_id is not None and self._data_by_id.get(filed_id) is inst:
+                del self._data_by_id[filed_id]
+        inst._filed_in = None
+        for index, entry in enumerate(self._data):
+            if entry is inst or (inst_id is not None and
+                                 not isinstance(entry, ShareaboutsModel) and
+                                 self._id_of(entry) == inst_id):
+                del self._data[index]
+                break
+
+    def _remove_ids(self, inst_ids):
+        if not inst_ids:
+            return 0
+        for inst_id in inst_ids:
+            entry = self._data_by_id.pop(inst_id)
+            if isinstance(entry, ShareaboutsModel):
+                self._unindex(entry)
+                entry.collection = None
+                entry._filed_in = None
+
+        def kept(entry):
+            if isinstance(entry, ShareaboutsModel):
+                return entry.collection is self
+            return self._id_of(entry) not in inst_ids
+
+        self._data = [entry for entry in self._data if kept(entry)]
+        return len(inst_ids)
+
+
+def _merge_criteria(dicts, kwargs):
+    criteria = {}
+    for extra in dicts:
+        criteria.update(extra)
+    criteria.update(kwargs)
+    return criteria
+
+
+def _lookup_all(index, values):
+    return [inst for value in values for inst in index.lookup(value)]
+
+
+def _matches(value, test, arg):
+    if isinstance(value, list):
+        return any(test(item, arg) for item in value) or test(value, arg)
+    return test(value, arg)
+
+
+class _LazyModels (Sequence):
+    """
+    Records added to a collection, as a sequence of the collection's
+    models, made on access.
+    """
+    def __init__(self, collection, entries):
+        self.collection = collection
+        self.entries = entries
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.collection._resolve(entry) for entry in self.entries[index]]
+        return self.collection._resolve(self.entries[index])
+
+    def __len__(self):
+        return len(self.entries)
 
 
 class ShareaboutsAccount (ShareaboutsModel):
@@ -274,9 +1100,15 @@ class ShareaboutsAccountSet (ShareaboutsCollection):
 class ShareaboutsDataset (ShareaboutsModel):
     _pk_attr = 'slug'
 
+    # The collection class used for the dataset's places; None means
+    # ShareaboutsPlaceSet. Set it to shareabouts.compact.CompactPlaceSet to
+    # hold places in compact column storage.
+    _place_set_class = None
+
     def __init__(self, api_proxy, *args, **kwargs):
         super(ShareaboutsDataset, self).__init__(api_proxy, *args, **kwargs)
-        self.places = ShareaboutsPlaceSet(api_proxy, self)
+        place_set_class = self._place_set_class or ShareaboutsPlaceSet
+        self.places = place_set_class(api_proxy, self)
         self.submissions = ShareaboutsSubmissionSet(api_proxy, self)
 
     @property
@@ -298,6 +1130,34 @@ class ShareaboutsDataset (ShareaboutsModel):
             data['submission_sets'] = {}
         return data
 
+    def _fields(self):
+        # The dataset's own fields, without its places and submissions.
+        return dict((key, value) for key, value in self._data.items()
+                    if key not in ('places', 'submission_sets'))
+
+    def _loaded_submission_sets(self):
+        """
+        Yields ``(place, submission set)`` for each submission set loaded
+        into the dataset, with a place of None for the dataset-wide sets.
+        """
+        for sset in self.submission_sets:
+            yield None, sset
+
+        # Only places that have been made into models can have submissions.
+        for place in self.places._materialized():
+            # Don't create submission sets just to find them empty.
+            submissions = place.__dict__.get('_submissions')
+            for sset in getattr(submissions, 'sets', {}).values():
+                yield place, sset
+
+    def export(self, fileobj, format='geojson', **options):
+        """
+        Writes the dataset to a file as GeoJSON or NDJSON, a record at a
+        time, rather than building it in memory as serialize does. See
+        shareabouts.export.export_dataset for the options.
+        """
+        return export_dataset(self, fileobj, format, **options)
+
     def __getattr__(self, submission_set_name):
         # Assume that unmatched attributes refer to a submission set
         return self.submissions.in_set(submission_set_name)
@@ -306,6 +1166,45 @@ class ShareaboutsDataset (ShareaboutsModel):
         # Even new datasets have a slug, so we check something else
         return 'created_datetime' not in self
 
+    @staticmethod
+    def _place_id_of(submission_data):
+        # A submission refers to its place by id, by url, or by embedding it.
+        place = submission_data.get('place')
+        if isinstance(place, dict):
+            place = place.get('id')
+        elif isinstance(place, string_types) and '/' in place:
+            place = place.rstrip('/').rsplit('/', 1)[-1]
+        if isinstance(place, string_types) and place.isdigit():
+            place = int(place)
+        return place
+
+    def load_submissions(self, *set_names, **options):
+        """
+        Loads every submission in the named sets into the submission sets of
+        the dataset's places, using the dataset-wide submissions endpoint.
+        Each set takes one request per page, however many places there are.
+        Submissions are grouped by place in a single pass, and each place's
+        set is filled with one update.
+
+        Submissions for places that aren't loaded in ``places`` are skipped.
+        Returns a dict of how many submissions were loaded for each set.
+        Any other options are passed as query parameters.
+        """
+        loaded = {}
+        for set_name in set_names:
+            by_place = {}
+            for submission_data in self.submissions.in_set(set_name).stream(**options):
+                place_id = self._place_id_of(submission_data)
+                by_place.setdefault(place_id, []).append(submission_data)
+
+            loaded[set_name] = 0
+            for place_id, submissions in by_place.items():
+                place = self.places.get(place_id)
+                if place is not None:
+                    place.submissions.in_set(set_name).update(submissions)
+                    loaded[set_name] += len(submissions)
+        return loaded
+
 
 class ShareaboutsDatasetSet (ShareaboutsCollection):
     _model_class = ShareaboutsDataset
@@ -320,7 +1219,7 @@ class ShareaboutsDatasetSet (ShareaboutsCollection):
         return dataset
 
     def url(self):
-        return self.owner.url() + '/datasets'
+        return self._child_url(self.owner.url(), '/datasets')
 
 
 def geojson_method(fname):
@@ -335,9 +1234,13 @@ def geojson_method(fname):
 class ShareaboutsPlace (ShareaboutsModel):
     _excluded_fields = ShareaboutsModel._excluded_fields + ['dataset', 'attachments', 'submissions', 'id']
 
-    def __init__(self, api_proxy, *args, **kwargs):
-        super(ShareaboutsPlace, self).__init__(api_proxy, *args, **kwargs)
-        self.submissions = ShareaboutsSubmissionSet(api_proxy, self)
+    @property
+    def submissions(self):
+        # Created on first use, since most places never need one.
+        submissions = self.__dict__.get('_submissions')
+        if submissions is None:
+            submissions = self._submissions = ShareaboutsSubmissionSet(self._api, self)
+        return submissions
 
     def __getattr__(self, submission_set_name):
         # Assume that unmatched attributes refer to a submission set
@@ -349,10 +1252,40 @@ class ShareaboutsPlace (ShareaboutsModel):
     def key(self):
         return self.get('id')
 
+    def _partial_data(self):
+        properties = self._data.get('properties', {})
+        send_data = {'type': 'Feature', 'properties': {}}
+        for key in self._changed:
+            if key == 'geometry' and key in self._data:
+                send_data['geometry'] = self._data['geometry']
+            elif key in self._data:
+                # Only geometry and properties can be sent in a patch.
+                return None
+            elif key in properties:
+                if key not in self._excluded_fields:
+                    send_data['properties'][key] = properties[key]
+            else:
+                return None
+        return send_data
+
     # Dictionary interface
     __getitem__ = geojson_method('__getitem__')
-    __setitem__ = geojson_method('__setitem__')
+    __contains__ = geojson_method('__contains__')
     get = geojson_method('get')
+    _set_geojson_item = geojson_method('__setitem__')
+    _del_geojson_item = geojson_method('__delitem__')
+
+    def __setitem__(self, key, value):
+        self._set_geojson_item(key, value)
+        self._changed.add(key)
+
+    def __delitem__(self, key):
+        self._del_geojson_item(key)
+        self._changed.add(key)
+
+    def update(self, other_data):
+        for key, value in dict(other_data).items():
+            self[key] = value
 
     def __iter__(self):
         for key in self._data:
@@ -377,7 +1310,51 @@ class ShareaboutsPlaceSet (ShareaboutsCollection):
         return inst
 
     def url(self):
-        return self.dataset.url() + '/places'
+        return self._child_url(self.dataset.url(), '/places')
+
+    def _field_of(self, inst_data, key):
+        if key in ('geometry', 'id'):
+            return inst_data.get(key)
+        return inst_data.get('properties', {}).get(key)
+
+    # Spatial queries
+    def spatial_index(self, cell_size=None):
+        """
+        Returns the collection's GridIndex, building it on first use. Pass a
+        ``cell_size`` (in degrees) to replace it with a new one.
+        """
+        index = getattr(self, '_spatial_index', None)
+        if index is None or (cell_size is not None and cell_size != index.cell_size):
+            if index is not None:
+                self.remove_index(index)
+            index = GridIndex(cell_size or 0.01)
+            self._spatial_index = self.add_index(index)
+        return index
+
+    def within_bbox(self, minx, miny, maxx, maxy):
+        return self.spatial_index().within_bbox(minx, miny, maxx, maxy)
+
+    def within_radius(self, x, y, meters):
+        return self.spatial_index().within_radius(x, y, meters)
+
+    def nearest(self, x, y, k=1):
+        return self.spatial_index().nearest(x, y, k)
+
+    # Clustering
+    def clusterer(self, **options):
+        """
+        Returns the collection's GridClusterer, building it on first use.
+        Passing options replaces it with a new one built with them.
+        """
+        clusterer = getattr(self, '_clusterer', None)
+        if clusterer is None or options:
+            if clusterer is not None:
+                self.remove_index(clusterer)
+            self._clusterer = self.add_index(GridClusterer(**options))
+        return self._clusterer
+
+    def cluster_tile(self, zoom, x, y):
+        return self.clusterer().tile(zoom, x, y)
 
 
 class ShareaboutsSubmission (ShareaboutsModel):
@@ -413,4 +1390,4 @@ class ShareaboutsSubmissionSet (ShareaboutsCollection):
             return self.sets[set_name]
 
     def url(self):
-        return self.parent.url() + '/' + self.name
+        return self._child_url(self.parent.url(), '/' + self.name)
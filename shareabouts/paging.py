@@ -0,0 +1,145 @@
+"""
+Page size tuning and checkpoints for ``ShareaboutsCollection.fetch_all``:
+
+    def save_checkpoint(checkpoint):
+        with open('places.checkpoint', 'w') as f:
+            json.dump(checkpoint.to_dict(), f)
+
+    for page in places.fetch_all(pager=AdaptivePager(target_seconds=2),
+                                 checkpoint=save_checkpoint, resume=saved):
+        process(page)
+
+A checkpoint is taken once the consumer is done with a page (when it asks
+for the next one), so resuming from it never skips a page that wasn't
+processed, though the last one may be processed twice.
+"""
+from __future__ import unicode_literals, division
+
+
+class Checkpoint (object):
+    """
+    How far fetch_all has got: the url of the next page (None once every
+    page has been fetched), the number of records before it, the counts so
+    far, and, if tracked, the ids of the records fetched. ``to_dict`` gives
+    a JSON-serializable form, which ``from_dict`` (or fetch_all's
+    ``resume``) takes back.
+    """
+    fields = ('url', 'params', 'next', 'offset', 'page_size', 'pages', 'records', 'ids')
+
+    def __init__(self, url, params=None, next=None, offset=0, page_size=None,
+                 pages=0, records=0, ids=None):
+        self.url = url
+        self.params = params or {}
+        self.next = next
+        self.offset = offset
+        self.page_size = page_size
+        self.pages = pages
+        self.records = records
+        self.ids = ids
+
+    @property
+    def done(self):
+        return self.pages > 0 and self.next is None
+
+    def advance(self, ids, next_url, page_size):
+        """
+        Records that a page with the given ids was fetched.
+        """
+        self.pages += 1
+        self.records += len(ids)
+        self.offset += len(ids)
+        self.next = next_url
+        self.page_size = page_size
+        if self.ids is not None:
+            self.ids.extend(ids)
+
+    def to_dict(self):
+        data = dict((field, getattr(self, field)) for field in self.fields)
+        if self.ids is not None:
+            data['ids'] = list(self.ids)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**dict((field, data.get(field)) for field in cls.fields
+                          if field in data))
+
+    def __str__(self):
+        return '<Checkpoint {0} pages, {1} records, next {2}>'.format(
+            self.pages, self.records, self.next)
+
+
+class AdaptivePager (object):
+    """
+    Chooses the size of each page for fetch_all from how long the pages so
+    far took, aiming for pages that take ``target_seconds`` each (and, if
+    ``max_page_bytes`` is set, that are no larger than that). Small pages
+    waste time on round trips; large ones use more memory and lose more
+    work when a request fails.
+
+    The API numbers pages by their size, so the size can only change where
+    the records fetched so far fill a whole number of pages of the new
+    size. Sizes are therefore ``min_page_size`` times a power of two, and
+    grow at most twofold from one page to the next.
+    """
+    def __init__(self, target_seconds=1.0, min_page_size=50, max_page_size=2000,
+                 max_page_bytes=None, smoothing=0.5):
+        self.target_seconds = target_seconds
+        self.min_page_size = min_page_size
+        self.max_page_size = max_page_size
+        self.max_page_bytes = max_page_bytes
+        self.smoothing = smoothing
+
+        self.seconds_per_record = None
+        self.bytes_per_record = None
+        self.sizes = []
+
+    def _average(self, current, observed):
+        if current is None:
+            return observed
+        return current + self.smoothing * (observed - current)
+
+    def _ladder(self, limit):
+        # The largest page size on the ladder that is at most limit.
+        size = self.min_page_size
+        while size * 2 <= min(limit, self.max_page_size):
+            size *= 2
+        return size
+
+    def first_size(self, page_size):
+        return self._ladder(page_size)
+
+    def observe(self, records, seconds, nbytes=None):
+        if not records:
+            return
+        self.seconds_per_record = self._average(self.seconds_per_record, seconds / records)
+        if nbytes:
+            self.bytes_per_record = self._average(self.bytes_per_record, nbytes / records)
+
+    def target_size(self):
+        """
+        The page size that the measurements so far suggest.
+        """
+        if not self.seconds_per_record:
+            return self.max_page_size
+        target = self.target_seconds / self.seconds_per_record
+        if self.max_page_bytes and self.bytes_per_record:
+            target = min(target, self.max_page_bytes / self.bytes_per_record)
+        return max(self.min_page_size, min(self.max_page_size, target))
+
+    def next_size(self, current, offset):
+        """
+        Returns the size of the page that starts after ``offset`` records,
+        the last page having been ``current`` records.
+        """
+        target = self.target_size()
+        size = current
+        if target >= current * 2 and current * 2 <= self.max_page_size:
+            size = current * 2
+        elif target < current:
+            size = self._ladder(target)
+
+        if offset % size:
+            size = current
+        self.sizes.append(size)
+        return size
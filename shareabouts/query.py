@@ -0,0 +1,311 @@
+"""
+Secondary indexes over model fields, for local queries on a collection:
+
+    places.index_on('location_type')
+    places.index_on('created_datetime', ordered=True)
+
+    places.filter(location_type='park')
+    places.count(location_type='park', submitter_name__in=['ann', 'bob'])
+    places.count_by('location_type')
+    places.range('created_datetime', datetime(2013, 5, 1), datetime(2013, 6, 1))
+
+A field is named by a path: a key of the model (for a place, a key of its
+properties, or ``geometry`` or ``id``), then keys of nested dicts, joined
+with dots (``submitter.username``). Queries on fields without an index scan
+the collection.
+
+Indexes are kept current as records are added, updated, saved and removed
+through the collection; a model edited in place is reindexed when it is
+saved.
+"""
+from __future__ import unicode_literals
+
+import bisect
+import datetime
+import itertools
+import re
+from numbers import Number
+
+try:
+    # Python 2
+    string_types = basestring
+except NameError:
+    # Python 3
+    string_types = str
+
+
+DATETIME = re.compile(
+    r'^(\d{4})-(\d\d)-(\d\d)'
+    r'(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6})\d*)?)?'
+    r'(Z|[+-]\d\d:?\d\d)?)?$')
+
+
+class _UTC (datetime.tzinfo):
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return 'UTC'
+
+UTC = _UTC()
+
+
+def parse_datetime(value):
+    """
+    Parses an ISO 8601 date or datetime string, as the API returns them,
+    into a naive datetime in UTC. Returns None if the string isn't one.
+    """
+    match = DATETIME.match(value)
+    if match is None:
+        return None
+
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    parsed = datetime.datetime(int(year), int(month), int(day),
+                               int(hour or 0), int(minute or 0), int(second or 0),
+                               int((fraction or '0').ljust(6, '0')))
+    if zone and zone != 'Z':
+        sign = -1 if zone[0] == '-' else 1
+        zone = zone[1:].replace(':', '')
+        offset = datetime.timedelta(hours=int(zone[:2]), minutes=int(zone[2:]))
+        parsed -= sign * offset
+    return parsed
+
+
+def sort_key(value):
+    """
+    Returns a key that orders values of different types consistently:
+    numbers, then datetimes (including ISO 8601 strings, compared as
+    datetimes in UTC), then other strings. Returns None for anything else.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, Number):
+        return (0, value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(UTC).replace(tzinfo=None)
+        return (1, value)
+    if isinstance(value, datetime.date):
+        return (1, datetime.datetime(value.year, value.month, value.day))
+    if isinstance(value, string_types):
+        parsed = parse_datetime(value)
+        return (1, parsed) if parsed is not None else (2, value)
+    return None
+
+
+def field_getter(path):
+    """
+    Returns a function that reads the field at a dotted path from a model,
+    or None where it is missing.
+    """
+    first, rest = path.split('.')[0], path.split('.')[1:]
+
+    def get(inst):
+        value = inst.get(first)
+        for key in rest:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+    return get
+
+
+def index_values(value):
+    # The keys a value is filed under in a HashIndex; each item of a list.
+    if isinstance(value, (list, tuple)):
+        return [item for item in value if not isinstance(item, (dict, list))]
+    if isinstance(value, dict):
+        return []
+    return [value]
+
+
+class HashIndex (object):
+    """
+    Maps each value of a field to the models that have it, for equality
+    lookups and counts. A model whose field is a list is filed under each
+    item of the list.
+    """
+    ordered = False
+
+    def __init__(self, path):
+        self.path = path
+        self.getter = field_getter(path)
+        self._buckets = {}
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, inst):
+        self.discard(inst)
+        values = index_values(self.getter(inst))
+        for value in values:
+            self._buckets.setdefault(value, {})[id(inst)] = inst
+        self._entries[id(inst)] = values
+
+    def discard(self, inst):
+        values = self._entries.pop(id(inst), None)
+        if values is None:
+            return
+        for value in values:
+            bucket = self._buckets[value]
+            del bucket[id(inst)]
+            if not bucket:
+                del self._buckets[value]
+
+    def values(self):
+        return list(self._buckets)
+
+    def lookup(self, value):
+        """
+        Returns the models whose field equals the value.
+        """
+        bucket = self._buckets.get(value)
+        return list(bucket.values()) if bucket else []
+
+    def count(self, value):
+        return len(self._buckets.get(value, ()))
+
+    def groups(self):
+        return dict((value, list(bucket.values()))
+                    for value, bucket in self._buckets.items())
+
+    def counts(self):
+        return dict((value, len(bucket)) for value, bucket in self._buckets.items())
+
+
+class SortedIndex (HashIndex):
+    """
+    A HashIndex that also keeps the models in order of their field, for
+    range queries. Values are ordered by ``sort_key``, so datetimes given
+    as ISO 8601 strings compare as datetimes.
+
+    The order is built on the first range query and then kept up to date
+    one model at a time, so loading many models costs no more than for a
+    HashIndex.
+    """
+    ordered = True
+
+    def __init__(self, path):
+        super(SortedIndex, self).__init__(path)
+        self._keys = {}
+        self._sorted = None
+        self._counter = itertools.count()
+
+    def add(self, inst):
+        super(SortedIndex, self).add(inst)
+        key = sort_key(self.getter(inst))
+        if key is None:
+            return
+
+        entry = (key, next(self._counter), inst)
+        self._keys[id(inst)] = entry
+        if self._sorted is not None:
+            bisect.insort(self._sorted, entry)
+
+    def discard(self, inst):
+        super(SortedIndex, self).discard(inst)
+        entry = self._keys.pop(id(inst), None)
+        if entry is None or self._sorted is None:
+            return
+
+        # The counter makes every entry distinct, so it is found exactly.
+        position = bisect.bisect_left(self._sorted, entry)
+        del self._sorted[position]
+
+    def _ordered(self):
+        if self._sorted is None:
+            self._sorted = sorted(self._keys.values())
+        return self._sorted
+
+    def range(self, start=None, end=None, include_end=False):
+        """
+        Returns the models whose field is at least ``start`` and less than
+        ``end`` (or equal to it, with ``include_end``), in order. Either
+        bound may be None for no bound.
+        """
+        low, high = range_bounds(start, end)
+        entries = self._ordered()
+        first = 0 if low is None else bisect.bisect_left(entries, (low,))
+        if high is None:
+            last = len(entries)
+        else:
+            # (high,) sorts before every entry with that key, and
+            # (high, INFINITY) after them.
+            last = bisect.bisect_left(entries, (high, INFINITY) if include_end else (high,))
+        return [entry[2] for entry in entries[first:last]]
+
+
+INFINITY = float('inf')
+
+
+def range_bounds(start, end):
+    """
+    Returns the sort keys of the bounds of a range. A range only covers
+    values of the same kind as its bounds (numbers, datetimes or strings),
+    so an open bound is replaced by the first or last key of that kind.
+    """
+    low = sort_key(start) if start is not None else None
+    high = sort_key(end) if end is not None else None
+    if (low is None and start is not None) or (high is None and end is not None):
+        raise ValueError('Can not order the range {0!r} to {1!r}'.format(start, end))
+    if low is not None and high is not None and low[0] != high[0]:
+        raise ValueError('The range {0!r} to {1!r} mixes kinds of values'.format(start, end))
+
+    if low is None and high is not None:
+        low = (high[0],)
+    if high is None and low is not None:
+        high = (low[0] + 1,)
+    return low, high
+
+
+def in_range(key, low, high, include_end=False):
+    if key is None:
+        return False
+    if low is not None and key < low:
+        return False
+    return high is None or key < high or (include_end and key == high)
+
+
+# Lookups for filter criteria, as in Django: ``field__lookup=value``.
+LOOKUPS = {
+    'exact': lambda value, arg: value == arg,
+    'in': lambda value, arg: value in arg,
+    'gt': lambda value, arg: _compare(value, arg) > 0,
+    'gte': lambda value, arg: _compare(value, arg) >= 0,
+    'lt': lambda value, arg: _compare(value, arg) < 0,
+    'lte': lambda value, arg: _compare(value, arg) <= 0,
+    'isnull': lambda value, arg: (value is None) == bool(arg),
+}
+
+
+def _compare(value, arg):
+    # None where the two can't be ordered, which fails every comparison.
+    value_key, arg_key = sort_key(value), sort_key(arg)
+    if value_key is None or arg_key is None or value_key[0] != arg_key[0]:
+        return _Unordered
+    return (value_key > arg_key) - (value_key < arg_key)
+
+
+class _UnorderedType (object):
+    # Compares false with everything.
+    __lt__ = __le__ = __gt__ = __ge__ = lambda self, other: False
+
+_Unordered = _UnorderedType()
+
+
+def parse_criteria(criteria):
+    """
+    Splits ``{'field__lookup': arg}`` criteria into a list of
+    ``(path, lookup, arg)``.
+    """
+    parsed = []
+    for name, arg in criteria.items():
+        path, _, lookup = name.rpartition('__')
+        if not path or lookup not in LOOKUPS:
+            path, lookup = name, 'exact'
+        parsed.append((path, lookup, arg))
+    return parsed
@@ -0,0 +1,171 @@
+from __future__ import unicode_literals, division
+
+import random
+import threading
+import time
+from email.utils import mktime_tz, parsedate_tz
+
+import requests
+
+
+# A clock that doesn't jump when the system time is changed, where available.
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+class RetryPolicy (object):
+    """
+    Decides whether and when ``ShareaboutsApi.send`` retries a request,
+    for use with ``ShareaboutsApi(retry=...)``.
+
+    A request is retried, at most ``total`` times, when it fails to connect
+    or times out, or when the server answers with one of
+    ``status_forcelist``. Only idempotent methods are retried unless
+    ``retry_post`` is set, since a POST whose response was lost may already
+    have created something.
+
+    Retries wait with exponential backoff and "full jitter": the n-th retry
+    waits a random time between 0 and ``backoff_factor * 2 ** n`` seconds
+    (capped at ``max_backoff``), which keeps clients that failed together
+    from retrying together. A ``Retry-After`` header is honored instead, up
+    to ``max_retry_after`` seconds; if the server asks for longer, its
+    response is returned as is.
+    """
+    idempotent_methods = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+    retry_exceptions = (requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout)
+
+    def __init__(self, total=3, backoff_factor=0.5, max_backoff=30,
+                 status_forcelist=(429, 502, 503, 504), retry_post=False,
+                 max_retry_after=120, sleep=time.sleep):
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.status_forcelist = frozenset(status_forcelist)
+        self.retry_post = retry_post
+        self.max_retry_after = max_retry_after
+        self.sleep = sleep
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def count_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def is_retryable_method(self, method):
+        return method in self.idempotent_methods or (self.retry_post and method == 'POST')
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+    def retry_after(self, response):
+        """
+        Returns the number of seconds a ``Retry-After`` header asks for, or
+        None if there is no (valid) header.
+        """
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+
+        date = parsedate_tz(value)
+        if date is None:
+            return None
+        return max(mktime_tz(date) - time.time(), 0)
+
+    def delay_for_error(self, method, attempt, error):
+        """
+        Returns how long to wait before retrying after the exception, or
+        None if it shouldn't be retried.
+        """
+        if (attempt >= self.total or not self.is_retryable_method(method)
+                or not isinstance(error, self.retry_exceptions)):
+            return None
+        return self.backoff(attempt)
+
+    def delay_for_response(self, method, attempt, response):
+        """
+        Returns how long to wait before retrying after the response, or
+        None if it should be returned.
+        """
+        if (attempt >= self.total or not self.is_retryable_method(method)
+                or response.status_code not in self.status_forcelist):
+            return None
+
+        retry_after = self.retry_after(response)
+        if retry_after is None:
+            return self.backoff(attempt)
+        if retry_after > self.max_retry_after:
+            return None
+        return retry_after
+
+
+class TokenBucket (object):
+    """
+    A client-side rate limiter, for use with
+    ``ShareaboutsApi(rate_limiter=...)``. It allows ``rate`` requests per
+    second on average, with bursts of up to ``burst`` requests, across
+    every thread that shares it.
+
+    When the server answers 429 with a ``Retry-After``, the API object
+    pauses the bucket, so every thread waits rather than just the one that
+    was refused.
+    """
+    def __init__(self, rate, burst=None, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.sleep = sleep
+
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = monotonic()
+        self._paused_until = 0
+        self.waited = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _check(self, tokens):
+        if tokens > self.burst:
+            raise ValueError('Can not take {0} tokens at once from a bucket that '
+                             'holds {1}'.format(tokens, self.burst))
+
+    def try_acquire(self, tokens=1):
+        self._check(tokens)
+        with self._lock:
+            now = monotonic()
+            self._refill(now)
+            if now >= self._paused_until and self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until ``tokens`` are available and takes them. Returns the
+        number of seconds spent waiting. Raises ValueError if ``tokens`` is
+        more than the bucket can hold.
+        """
+        self._check(tokens)
+        waited = 0
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.waited += waited
+                    return waited
+                delay = max(self._paused_until - now,
+                            (tokens - self._tokens) / self.rate)
+            self.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """
+        Hands out no tokens for the next ``seconds``.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, monotonic() + seconds)
@@ -0,0 +1,119 @@
+from __future__ import unicode_literals
+
+import json
+import os
+import sqlite3
+import time
+from itertools import groupby
+
+from shareabouts.codec import ShareaboutsEncoder
+
+
+SNAPSHOT_VERSION = 1
+
+SCHEMA = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE places (id, data TEXT);
+CREATE TABLE submissions (set_name TEXT, place_id, data TEXT);
+'''
+
+
+class SnapshotStore (object):
+    """
+    Saves a dataset, with its places and loaded submission sets, to a local
+    SQLite file, and loads it back.
+
+    A snapshot is written to a temporary file that then replaces the old one
+    atomically, and is read through a read-only connection. Any number of
+    processes on a host can therefore load the same snapshot while another
+    one refreshes it. After loading, ``places.sync()`` fetches only what
+    changed on the server since the snapshot was taken.
+
+        store = SnapshotStore('/var/cache/shareabouts/demo.sqlite')
+        dataset = api.account('alice').dataset('demo')
+        if store.exists():
+            store.load(dataset, catch_up=True)
+        else:
+            list(dataset.places.fetch_all())
+            store.save(dataset)
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def save(self, dataset):
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        dumps = lambda data: json.dumps(data, cls=ShareaboutsEncoder)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            with conn:
+                conn.executescript(SCHEMA)
+                conn.executemany('INSERT INTO meta VALUES (?, ?)', [
+                    ('version', dumps(SNAPSHOT_VERSION)),
+                    ('saved_at', dumps(time.time())),
+                    ('dataset', dumps(dataset._fields())),
+                    ('places_sync_mark', dumps(dataset.places._sync_mark)),
+                ])
+                conn.executemany('INSERT INTO places VALUES (?, ?)', (
+                    (place_data.get('id'), dumps(place_data))
+                    for place_data in dataset.places.serialize()))
+                conn.executemany('INSERT INTO submissions VALUES (?, ?, ?)',
+                                 self._submission_rows(dataset, dumps))
+        finally:
+            conn.close()
+
+        replace = getattr(os, 'replace', os.rename)
+        replace(tmp_path, self.path)
+
+    def _submission_rows(self, dataset, dumps):
+        for place, sset in dataset._loaded_submission_sets():
+            place_id = place.key() if place is not None else None
+            for submission_data in sset._iter_serialized():
+                yield sset.name, place_id, dumps(submission_data)
+
+    def _connect(self):
+        try:
+            return sqlite3.connect('file:{0}?mode=ro'.format(self.path), uri=True)
+        except TypeError:
+            # Python 2's sqlite3 doesn't take uris
+            return sqlite3.connect(self.path)
+
+    def load(self, dataset, catch_up=False):
+        """
+        Loads the snapshot into the dataset and returns the time it was
+        saved. With ``catch_up``, the places are then synced with the
+        server.
+        """
+        conn = self._connect()
+        try:
+            meta = dict((key, json.loads(value)) for key, value
+                        in conn.execute('SELECT key, value FROM meta'))
+
+            dataset._load(meta['dataset'])
+            dataset.places.update(
+                json.loads(data) for (data,) in
+                conn.execute('SELECT data FROM places ORDER BY rowid'))
+
+            rows = conn.execute('SELECT set_name, place_id, data FROM submissions '
+                                'ORDER BY set_name, place_id, rowid')
+            for (set_name, place_id), group in groupby(rows, lambda row: row[:2]):
+                submissions = [json.loads(data) for _, _, data in group]
+                if place_id is None:
+                    owner = dataset
+                else:
+                    owner = dataset.places.get(place_id)
+                    if owner is None:
+                        continue
+                owner.submissions.in_set(set_name).update(submissions)
+        finally:
+            conn.close()
+
+        dataset.places._sync_mark = meta.get('places_sync_mark')
+        if catch_up:
+            dataset.places.sync()
+        return meta.get('saved_at')
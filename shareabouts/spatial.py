@@ -0,0 +1,223 @@
+from __future__ import unicode_literals, division
+
+import heapq
+import math
+
+
+# Metres per degree of latitude (or of longitude at the equator), on a
+# sphere with the mean radius of the Earth.
+METERS_PER_DEGREE = 6371008.8 * math.pi / 180
+
+
+def geometry_bbox(geometry):
+    """
+    Returns the ``(minx, miny, maxx, maxy)`` bounds of a GeoJSON geometry, or
+    None if it has no coordinates.
+    """
+    if not geometry:
+        return None
+
+    if geometry.get('type') == 'Point':
+        coords = geometry.get('coordinates')
+        if not coords:
+            return None
+        x, y = coords[0], coords[1]
+        return (x, y, x, y)
+
+    if geometry.get('type') == 'GeometryCollection':
+        boxes = [geometry_bbox(g) for g in geometry.get('geometries', [])]
+        boxes = [b for b in boxes if b is not None]
+    else:
+        boxes = [(x, y, x, y) for x, y in _positions(geometry.get('coordinates'))]
+
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def _positions(coords):
+    if not coords:
+        return
+    if isinstance(coords[0], (int, float)):
+        yield coords[0], coords[1]
+    else:
+        for child in coords:
+            for position in _positions(child):
+                yield position
+
+
+def distance(x1, y1, x2, y2):
+    """
+    The approximate distance in metres between two lon/lat points, using an
+    equirectangular projection. Accurate to well under a percent at the
+    scale of a city.
+    """
+    dx = (x2 - x1) * math.cos(math.radians((y1 + y2) / 2))
+    dy = y2 - y1
+    return math.sqrt(dx * dx + dy * dy) * METERS_PER_DEGREE
+
+
+def _bbox_distance(x, y, bbox):
+    # Distance from a point to the nearest point of a bounding box.
+    nx = min(max(x, bbox[0]), bbox[2])
+    ny = min(max(y, bbox[1]), bbox[3])
+    return distance(x, y, nx, ny)
+
+
+class GridIndex (object):
+    """
+    A uniform grid over lon/lat space, for fast bounding box, radius and
+    nearest-neighbour queries over place geometries. Use it as a collection
+    index:
+
+        index = places.add_index(GridIndex(cell_size=0.01))
+        index.within_bbox(-75.2, 39.9, -75.1, 40.0)
+
+    ``cell_size`` is in degrees; a good value is about the size of a typical
+    query. Geometries other than points are stored in every cell their
+    bounding box covers.
+    """
+    def __init__(self, cell_size=0.01):
+        self.cell_size = cell_size
+        self._cells = {}
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cell(self, x, y):
+        return (int(math.floor(x / self.cell_size)),
+                int(math.floor(y / self.cell_size)))
+
+    def _cell_range(self, minx, miny, maxx, maxy):
+        x0, y0 = self._cell(minx, miny)
+        x1, y1 = self._cell(maxx, maxy)
+        return x0, y0, x1, y1
+
+    def add(self, inst):
+        self.discard(inst)
+
+        bbox = geometry_bbox(inst.get('geometry'))
+        if bbox is None:
+            return
+
+        x0, y0, x1, y1 = self._cell_range(*bbox)
+        cells = [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+        for cell in cells:
+            self._cells.setdefault(cell, {})[id(inst)] = inst
+        self._entries[id(inst)] = (bbox, cells)
+
+    def discard(self, inst):
+        entry = self._entries.pop(id(inst), None)
+        if entry is None:
+            return
+
+        for cell in entry[1]:
+            members = self._cells[cell]
+            del members[id(inst)]
+            if not members:
+                del self._cells[cell]
+
+    def _candidates(self, minx, miny, maxx, maxy):
+        x0, y0, x1, y1 = self._cell_range(minx, miny, maxx, maxy)
+
+        # For very large boxes it is cheaper to walk the occupied cells.
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+            cells = [members for (cx, cy), members in self._cells.items()
+                     if x0 <= cx <= x1 and y0 <= cy <= y1]
+        else:
+            cells = [self._cells[(cx, cy)]
+                     for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)
+                     if (cx, cy) in self._cells]
+
+        seen = {}
+        for members in cells:
+            seen.update(members)
+        return seen
+
+    def within_bbox(self, minx, miny, maxx, maxy):
+        """
+        Returns the instances whose geometry's bounding box intersects the
+        given box.
+        """
+        results = []
+        for key, inst in self._candidates(minx, miny, maxx, maxy).items():
+            bbox = self._entries[key][0]
+            if bbox[0] <= maxx and bbox[2] >= minx and bbox[1] <= maxy and bbox[3] >= miny:
+                results.append(inst)
+        return results
+
+    def within_radius(self, x, y, meters):
+        """
+        Returns the instances within ``meters`` of the point, nearest first.
+        """
+        dy = meters / METERS_PER_DEGREE
+        dx = dy / max(math.cos(math.radians(y)), 1e-6)
+
+        found = []
+        for key, inst in self._candidates(x - dx, y - dy, x + dx, y + dy).items():
+            d = _bbox_distance(x, y, self._entries[key][0])
+            if d <= meters:
+                found.append((d, key, inst))
+        found.sort()
+        return [inst for _, _, inst in found]
+
+    def nearest(self, x, y, k=1):
+        """
+        Returns the ``k`` instances nearest to the point, nearest first.
+        """
+        if not self._entries:
+            return []
+
+        cx, cy = self._cell(x, y)
+
+        # Anything outside ring r is at least r cells away, in degrees of
+        # latitude or (shorter) degrees of longitude.
+        cell_meters = (self.cell_size * METERS_PER_DEGREE *
+                       max(math.cos(math.radians(min(abs(y) + self.cell_size, 90))), 1e-6))
+
+        best = []
+        seen = set()
+
+        def consider(members):
+            for key, inst in members.items():
+                if key in seen:
+                    continue
+                seen.add(key)
+                d = _bbox_distance(x, y, self._entries[key][0])
+                item = (-d, key, inst)
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+
+        ring = 0
+        while True:
+            # Once the rings cover more cells than are occupied, visiting the
+            # occupied cells directly is cheaper.
+            if (2 * ring + 1) ** 2 > 4 * len(self._cells):
+                for members in self._cells.values():
+                    consider(members)
+                break
+
+            for cell in self._ring(cx, cy, ring):
+                if cell in self._cells:
+                    consider(self._cells[cell])
+
+            if len(best) == k and -best[0][0] <= ring * cell_meters:
+                break
+            ring += 1
+
+        return [inst for _, _, inst in sorted(best, reverse=True)]
+
+    def _ring(self, cx, cy, ring):
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
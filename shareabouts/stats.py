@@ -0,0 +1,240 @@
+from __future__ import unicode_literals, division
+
+import bisect
+import math
+import threading
+import time
+
+
+# A high resolution clock for timing single operations.
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def percentile(sorted_values, p):
+    """
+    Returns the p-th percentile (0-100) of an already sorted list, using the
+    nearest-rank method.
+    """
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+class LatencyStats (object):
+    """
+    Collects per-operation latencies and error counts for a batch of work,
+    and summarizes them as throughput and latency percentiles. Operations
+    that turned out to need no work are counted as ``skipped`` rather than
+    timed.
+    """
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.skipped = 0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started = timer()
+
+    def stop(self):
+        self.finished = timer()
+
+    def record(self, seconds, error=False):
+        with self._lock:
+            self.latencies.append(seconds)
+            if error:
+                self.errors += 1
+
+    def skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0
+        return (self.finished or timer()) - self.started
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        elapsed = self.elapsed
+        return {
+            'count': len(latencies),
+            'errors': self.errors,
+            'skipped': self.skipped,
+            'seconds': elapsed,
+            'records_per_sec': (len(latencies) / elapsed if elapsed else None),
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+        }
+
+
+# The events that ShareaboutsApi reports to hooks registered with add_hook.
+EVENTS = ('before_request', 'after_response', 'after_parse', 'after_hydrate')
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+                 16777216)
+
+
+class Histogram (object):
+    """
+    Counts observations into fixed buckets, Prometheus style. ``buckets``
+    are the upper bounds; anything larger lands in an implicit +Inf bucket.
+    """
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        Returns ``(upper_bound, count)`` pairs, with each count including
+        every smaller bucket, ending with ``(inf, total)``.
+        """
+        pairs, total = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q):
+        """
+        Estimates the q-th quantile (0-1) as the upper bound of the bucket
+        that holds it.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+
+
+def _label_string(labels):
+    return ','.join('{0}="{1}"'.format(
+        key, ('{0}'.format(value)).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsCollector (object):
+    """
+    A hook that records ShareaboutsApi events as histograms, labelled with
+    the uri template name of each request:
+
+        metrics = MetricsCollector()
+        metrics.install(api)
+        ...
+        metrics.stats()       # a dict, for logging
+        metrics.prometheus()  # the Prometheus text exposition format
+
+    It records ``request_seconds`` (by template, method and status),
+    ``ttfb_seconds`` (time until the response headers arrived),
+    ``response_bytes``, ``parse_seconds`` and ``hydrate_seconds`` (by model
+    class), and counts ``hydrated_models_total``.
+    """
+    def __init__(self, prefix='shareabouts'):
+        self.prefix = prefix
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def install(self, api):
+        for event in EVENTS:
+            api.add_hook(event, self)
+        return self
+
+    def uninstall(self, api):
+        for event in EVENTS:
+            api.remove_hook(event, self)
+
+    def observe(self, name, labels, value, buckets=SECONDS_BUCKETS):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def __call__(self, event, info):
+        if event == 'after_response':
+            status = 'error' if info['status'] is None else str(info['status'])
+            labels = (('template', info['template']), ('method', info['method']))
+            self.observe('request_seconds', labels + (('status', status),), info['seconds'])
+            if info.get('ttfb') is not None:
+                self.observe('ttfb_seconds', labels, info['ttfb'])
+            if info.get('bytes') is not None:
+                self.observe('response_bytes', labels, info['bytes'], BYTES_BUCKETS)
+
+        elif event == 'after_parse':
+            self.observe('parse_seconds', (('template', info['template']),), info['seconds'])
+
+        elif event == 'after_hydrate':
+            labels = (('model', info['model']),)
+            self.observe('hydrate_seconds', labels, info['seconds'])
+            self.increment('hydrated_models_total', labels, info['count'])
+
+    def stats(self):
+        """
+        Returns the metrics as ``{name: {label string: summary}}``, where a
+        histogram's summary has its count, sum, p50 and p99 (bucket
+        estimates), and a counter's summary is its value.
+        """
+        with self._lock:
+            result = {}
+            for (name, labels), histogram in self._histograms.items():
+                result.setdefault(name, {})[_label_string(labels)] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'p50': histogram.quantile(0.5),
+                    'p99': histogram.quantile(0.99),
+                }
+            for (name, labels), value in self._counters.items():
+                result.setdefault(name, {})[_label_string(labels)] = value
+            return result
+
+    def prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(set(name for name, _ in self._histograms)):
+                metric = '{0}_{1}'.format(self.prefix, name)
+                lines.append('# TYPE {0} histogram'.format(metric))
+                for (other, labels), histogram in sorted(self._histograms.items()):
+                    if other != name:
+                        continue
+                    for bound, total in histogram.cumulative():
+                        lines.append('{0}_bucket{{{1}}} {2}'.format(
+                            metric, _label_string(labels + (('le', _number(bound)),)), total))
+                    label_string = _label_string(labels)
+                    lines.append('{0}_sum{{{1}}} {2}'.format(metric, label_string, _number(histogram.sum)))
+                    lines.append('{0}_count{{{1}}} {2}'.format(metric, label_string, histogram.count))
+
+            for name in sorted(set(name for name, _ in self._counters)):
+                metric = '{0}_{1}'.format(self.prefix, name)
+                lines.append('# TYPE {0} counter'.format(metric))
+                for (other, labels), value in sorted(self._counters.items()):
+                    if other == name:
+                        lines.append('{0}{{{1}}} {2}'.format(metric, _label_string(labels), value))
+        return '\n'.join(lines) + '\n'
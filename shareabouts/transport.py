@@ -0,0 +1,65 @@
+from __future__ import unicode_literals
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    # Python 2
+    from cookielib import DefaultCookiePolicy
+except ImportError:
+    # Python 3
+    from http.cookiejar import DefaultCookiePolicy
+
+
+class SimpleTransport (object):
+    """
+    Sends every request through the module-level ``requests.request``, so
+    each call opens (and tears down) its own connection.
+    """
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def request(self, method, url, data=None, headers=None, auth=None,
+                stream=False):
+        return requests.request(method, url, data=data, headers=headers,
+                                auth=auth, timeout=self.timeout,
+                                stream=stream)
+
+    def close(self):
+        pass
+
+
+class PooledTransport (object):
+    """
+    Sends requests over a shared ``requests.Session``, keeping connections
+    alive in a per-host pool.
+
+    The underlying urllib3 pools are thread safe, so one transport (and the
+    ``ShareaboutsApi`` that owns it) can be shared across worker threads.
+    ``pool_connections`` is the number of hosts to keep pools for, and
+    ``pool_maxsize`` is the number of connections kept open to each host;
+    set it to at least the number of threads that share the transport.
+
+    Cookies set by the server are not kept between requests; authentication
+    is left entirely to the headers that ``ShareaboutsApi`` sends.
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, timeout=None,
+                 max_retries=0, pool_block=False):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              max_retries=max_retries,
+                              pool_block=pool_block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, url, data=None, headers=None, auth=None,
+                stream=False):
+        return self.session.request(method, url, data=data, headers=headers,
+                                    auth=auth, timeout=self.timeout,
+                                    stream=stream)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,216 @@
+from __future__ import unicode_literals
+
+import atexit
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from shareabouts.stats import timer
+
+
+class _PendingWrite (object):
+    __slots__ = ('model', 'action', 'future', 'since')
+
+    def __init__(self, model, action, since):
+        self.model = model
+        self.action = action
+        self.future = Future()
+        self.since = since
+
+
+class WriteBehindQueue (object):
+    """
+    Queues model saves and deletes and sends them from background threads,
+    for use with ``ShareaboutsApi(write_behind=...)``. ``save()`` and
+    ``destroy()`` then return a Future at once instead of waiting for the
+    server; the future's result is the model, or its exception the error.
+
+    Saving a model that is already waiting to be saved doesn't queue another
+    request: the one request sends the model as it is when it goes out, and
+    every save returns the same future. Queued writes go out once
+    ``max_pending`` models are waiting or the oldest has waited
+    ``max_delay`` seconds, up to ``concurrency`` at a time. A model is
+    never written by two requests at once; if it is saved again while a
+    request for it is in flight, the new save waits for that one.
+
+    Destroying a model removes it from its collection right away. Replies
+    from the server are applied to the models from the queue's threads.
+    ``flush()`` waits until everything queued has been written, and is
+    called when the process exits.
+    """
+    def __init__(self, max_pending=100, max_delay=0.5, concurrency=4):
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+
+        self._cond = threading.Condition(threading.Lock())
+        self._pending = OrderedDict()
+        self._in_flight = {}
+        self._flushes = 0
+        self._closed = False
+        self._thread = None
+        self._executor = None
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.failed = 0
+
+    def save(self, model):
+        return self._enqueue(model, 'save')
+
+    def destroy(self, model):
+        return self._enqueue(model, 'destroy')
+
+    def _enqueue(self, model, action):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('The write-behind queue has been closed')
+            if self._thread is None:
+                self._start()
+
+            self.enqueued += 1
+            entry = self._pending.get(id(model))
+            if entry is not None:
+                self.coalesced += 1
+                if action == 'destroy':
+                    entry.action = action
+                return entry.future
+
+            entry = self._pending[id(model)] = _PendingWrite(model, action, timer())
+            self._cond.notify_all()
+            return entry.future
+
+    def _start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _next_batch(self):
+        # Waits until writes are due, and takes them off the queue. Returns
+        # None once the queue is closed and drained.
+        while True:
+            ready = [entry for key, entry in self._pending.items()
+                     if key not in self._in_flight]
+            if ready:
+                wait = ready[0].since + self.max_delay - timer()
+                if (self._closed or self._flushes or wait <= 0 or
+                        len(self._pending) >= self.max_pending):
+                    for entry in ready:
+                        del self._pending[id(entry.model)]
+                        self._in_flight[id(entry.model)] = entry
+                    return ready
+                self._cond.wait(wait)
+            elif self._closed and not self._pending and not self._in_flight:
+                return None
+            else:
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._next_batch()
+            if batch is None:
+                return
+            for entry in batch:
+                self._executor.submit(self._write, entry)
+
+    def _write(self, entry):
+        model = entry.model
+        try:
+            if entry.action == 'destroy':
+                self._send_destroy(model)
+            else:
+                self._send_save(model)
+        except Exception as e:
+            self._finish(entry, error=e)
+        else:
+            self._finish(entry)
+
+    def _send_save(self, model):
+        request = model._save_request()
+        if request is None:
+            return
+
+        method, url, send_data, valid = request
+        response_data = model.api().send_and_parse(method, url, send_data, valid)
+
+        with self._cond:
+            next_write = self._pending.get(id(model))
+        if next_write is None:
+            model._load(response_data)
+            if model.collection is not None:
+                model.collection._reindex(model)
+        elif not model.has_key():
+            # Edits made since the request was built are waiting to be
+            # saved, so keep them, and take just the id the server assigned.
+            model._data[model._pk_attr] = response_data.get(model._pk_attr)
+            if next_write.action == 'save' and model.collection is not None:
+                model.collection._reindex(model)
+
+    def _send_destroy(self, model):
+        if not model.is_new():
+            api, url = model.api(), model.url()
+            response = api.send('DELETE', url)
+            if response.status_code >= 400:
+                raise api._invalid_response(url, response)
+        model.collection = None
+
+    def _finish(self, entry, error=None):
+        with self._cond:
+            del self._in_flight[id(entry.model)]
+            if error is None:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self._cond.notify_all()
+
+        if error is None:
+            entry.future.set_result(entry.model)
+        else:
+            entry.future.set_exception(error)
+
+    def flush(self, timeout=None):
+        """
+        Sends everything that is queued now, and waits until it and anything
+        queued meanwhile has been written. Returns False if that didn't
+        happen within ``timeout`` seconds.
+        """
+        deadline = None if timeout is None else timer() + timeout
+        with self._cond:
+            self._flushes += 1
+            self._cond.notify_all()
+            try:
+                while self._pending or self._in_flight:
+                    if deadline is None:
+                        self._cond.wait()
+                    else:
+                        remaining = deadline - timer()
+                        if remaining <= 0:
+                            return False
+                        self._cond.wait(remaining)
+                return True
+            finally:
+                self._flushes -= 1
+
+    def close(self, timeout=None):
+        """
+        Writes everything that is queued and stops the queue's threads.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self.flush(timeout)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._cond:
+            return {'enqueued': self.enqueued, 'coalesced': self.coalesced,
+                    'sent': self.sent, 'failed': self.failed,
+                    'pending': len(self._pending), 'in_flight': len(self._in_flight)}
@@ -0,0 +1,59 @@
+from __future__ import unicode_literals
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fakeapi import start_fake_api
+from shareabouts import ShareaboutsApi
+from shareabouts.models import ShareaboutsCollection
+
+
+class PartialUpdateTests (unittest.TestCase):
+    def setUp(self):
+        self.server = start_fake_api(places=3)
+        self.api = ShareaboutsApi(root=self.server.root, partial_updates=True)
+        self.places = self.api.account('alice').dataset('demo').places
+        self.places.fetch()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_update_sets_properties(self):
+        place = self.places.get(1)
+        place.update({'name': 'Renamed'})
+        place.save()
+
+        self.assertEqual(place['name'], 'Renamed')
+        self.assertEqual(self.server.data.places[1]['properties']['name'], 'Renamed')
+        self.assertNotIn('name', place._data)
+
+    def test_top_level_change_is_saved_whole(self):
+        place = self.places.get(2)
+        place._data['name'] = 'Renamed'
+        place.mark_changed('name')
+        self.assertIsNone(place._partial_data())
+
+    def test_changed_property_is_patched(self):
+        place = self.places.get(3)
+        place['name'] = 'Renamed'
+        self.assertEqual(place._partial_data(),
+                         {'type': 'Feature', 'properties': {'name': 'Renamed'}})
+
+
+class CollectionUpdateTests (unittest.TestCase):
+    def test_update_merges_into_models_and_records(self):
+        collection = ShareaboutsCollection(None)
+        collection.update([{'id': 1, 'a': 1, 'b': 2}, {'id': 2, 'a': 1, 'b': 2}])
+        collection.get(1)
+        collection.update([{'id': 1, 'a': 9}, {'id': 2, 'a': 9}])
+
+        self.assertEqual(collection.serialize(), [{'id': 1, 'a': 9, 'b': 2},
+                                                  {'id': 2, 'a': 9, 'b': 2}])
+
+
+if __name__ == '__main__':
+    unittest.main()